@@ -1,58 +1,210 @@
 # standard libraries
-import datetime
+import argparse
+import bisect
+import itertools
+import json
+import platform
 import random
+import sys
+import threading
+import time
 # third party libraries
 pass
 # first party libraries
 import bocce
 
 
-def sample_with_replacement(population, N):
-    i = 0
-    while i < N:
-        yield random.choice(population)
-        i += 1
-
-
-def benchmark(cache, matches=1e5):
-    # construct paths to match
-    paths = 50*('/', ) + \
-                 2*('/api', ) + \
-                 1*('/api/1.1', ) + \
-                25*('/api/1.1/users', ) + \
-                 2*('/api/1.1/users/guido', ) + \
-                10*('/api/health', ) + \
-                 3*('/api/1.1/users/guido/education', ) + \
-                 3*('/api/1.1/users/guido/parents', ) + \
-                 1*('/api/1.1/users/guido/children', ) + \
-                 1*('/api/users', )
-    paths = list(sample_with_replacement(paths, matches))
-
-    # setup routes
-    routes = bocce.Routes(cache)
-    routes['/'] = '/'
-    routes['/api'] = '/api'
-    routes['/api/{version}'] = '/api/{version}'
-    routes['/api/{version}/users'] = '/api/{version}/users'
-    routes['/api/{version}/users/{username}'] = '/api/{version}/users'
-    routes['/api/health'] = '/api/health'
-    routes['/api/{version}/users/{username}/education'] = '/api/{version}/users/{username}/education'
-    routes['/api/{version}/users/{username}/parents'] = '/api/{version}/users/{username}/parents'
-    routes['/api/{version}/users/{username}/children'] = '/api/{version}/users/{username}/children'
-    routes['/api/{version}/users/{username}/friends'] = '/api/{version}/users/{username}/friends'
-
-    # evaluate performance
-    when_started = datetime.datetime.utcnow()
-    for path in paths:
-        match = routes.match(path)
-    when_ended = datetime.datetime.utcnow()
-
-    duration = (when_ended - when_started).total_seconds()
-    duration_per_match = duration/float(matches)
-
-    return duration_per_match
+route_counts = (10, 100, 1000, 10000)
+junk_paths = (
+    '/wp-admin', '/wp-login.php', '/.env', '/.git/config', '/phpmyadmin',
+    '/admin.php', '/cgi-bin/test.cgi', '/xmlrpc.php', '/server-status',
+)
+
+
+def handler(request, response, configuration):
+    pass
+
+
+def create_routes(number_routes, cache=True):
+    """ Create a table resembling a versioned REST API.
+
+        Each resource contributes a collection route, an item route, and a
+        nested item route, so a third of the table is verbatim-only; a static
+        route with a pointy segment is always present.
+
+    """
+    if cache:
+        routes = bocce.Routes(share_handlers=True)
+    else:
+        routes = bocce.Routes(
+            cache_size=0, negative_cache_size=0, share_handlers=True
+        )
+    routes.add_handler('/', handler)
+    routes.add_handler('/api/health', handler)
+    routes.add_handler('/static/<path>', handler)
+    templates = (
+        '/api/{{version}}/resource{}',
+        '/api/{{version}}/resource{}/{{id}}',
+        '/api/{{version}}/resource{}/{{id}}/children',
+    )
+    for i in itertools.count():
+        for template in templates:
+            if len(routes) >= number_routes:
+                return routes
+            routes.add_handler(template.format(i), handler)
+
+
+def zipf_sampler(population, exponent=1.1, seed=0):
+    generator = random.Random(seed)
+    weights = [1.0/(rank**exponent) for rank in range(1, len(population) + 1)]
+    cumulative_weights = list(itertools.accumulate(weights))
+    total = cumulative_weights[-1]
+    def sample():
+        index = bisect.bisect(cumulative_weights, generator.random()*total)
+        return population[min(index, len(population) - 1)]
+    return sample
+
+
+def create_paths(routes, number_paths, miss_ratio=0.0, users=100000, seed=0):
+    """ Sample request paths, Zipf-distributed over the routes.
+
+        Placeholders are filled with ids drawn uniformly from a population of
+        users, so parameterized routes produce mostly unique paths.
+
+    """
+    generator = random.Random(seed)
+    sample_route = zipf_sampler(list(routes), seed=seed)
+    paths = []
+    for _ in range(number_paths):
+        if generator.random() < miss_ratio:
+            paths.append(generator.choice(junk_paths))
+            continue
+        route = sample_route()
+        path = '/' + route.path
+        path = path.replace('{version}', '1.1')
+        path = path.replace('{id}', str(generator.randrange(users)))
+        path = path.replace('<path>', 'css/site.css')
+        paths.append(path)
+    return paths
+
+
+def time_matches(routes, paths, threads=1):
+    # the first pass compiles the table so it is not charged to the workload
+    routes.match('/', 'GET')
+    def work(paths):
+        for path in paths:
+            routes.match(path, 'GET')
+    chunks = [paths[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=work, args=(chunk, )) for chunk in chunks]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    duration = time.perf_counter() - start
+    return duration/float(len(paths))
+
+
+scenarios = {
+    'cached': {'cache': True, 'miss_ratio': 0.0, 'threads': 1},
+    'uncached': {'cache': False, 'miss_ratio': 0.0, 'threads': 1},
+    'miss_heavy_cached': {'cache': True, 'miss_ratio': 0.9, 'threads': 1},
+    'miss_heavy_uncached': {'cache': False, 'miss_ratio': 0.9, 'threads': 1},
+    'threaded_cached': {'cache': True, 'miss_ratio': 0.1, 'threads': 16},
+}
+
+
+def benchmark(route_counts=route_counts, scenario_names=None, matches=100000,
+              repeat=3):
+    if scenario_names is None:
+        scenario_names = sorted(scenarios)
+    results = []
+    for number_routes in route_counts:
+        for scenario_name in scenario_names:
+            scenario = scenarios[scenario_name]
+            routes = create_routes(number_routes, scenario['cache'])
+            paths = create_paths(routes, matches, scenario['miss_ratio'])
+            # report the best of several runs; the cache is warm after the first
+            duration = min(
+                time_matches(routes, paths, scenario['threads'])
+                for _ in range(repeat)
+            )
+            result = {
+                'scenario': scenario_name,
+                'routes': number_routes,
+                'threads': scenario['threads'],
+                'usec_per_match': 1e6*duration,
+            }
+            if scenario['cache']:
+                result['cache'] = routes.cache.statistics
+            results.append(result)
+            print(
+                '{scenario:>20} {routes:>6} routes {threads:>3} threads: '
+                '{usec_per_match:8.2f} usec'.format(**result),
+                file=sys.stderr,
+            )
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'matches': matches,
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """ Return the results that are slower than the baseline by > tolerance. """
+    key = lambda result: (result['scenario'], result['routes'])
+    baseline_results = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        baseline_result = baseline_results.get(key(result))
+        if baseline_result is None:
+            continue
+        ratio = result['usec_per_match']/baseline_result['usec_per_match']
+        if ratio > 1.0 + tolerance:
+            regressions.append({
+                'scenario': result['scenario'],
+                'routes': result['routes'],
+                'usec_per_match': result['usec_per_match'],
+                'baseline_usec_per_match': baseline_result['usec_per_match'],
+                'ratio': ratio,
+            })
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark bocce routing.')
+    parser.add_argument('--routes', type=int, nargs='+', default=route_counts)
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(scenarios))
+    parser.add_argument('--matches', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--compare', help='baseline JSON report to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    arguments = parser.parse_args(arguments)
+    report = benchmark(
+        arguments.routes, arguments.scenarios, arguments.matches,
+        arguments.repeat,
+    )
+    if arguments.compare is not None:
+        with open(arguments.compare, 'r') as f:
+            baseline = json.load(f)
+        report['regressions'] = compare(report, baseline, arguments.tolerance)
+    if arguments.output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(arguments.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    if len(report.get('regressions', [])) > 0:
+        for regression in report['regressions']:
+            print(
+                'REGRESSION {scenario} with {routes} routes: {ratio:.2f}x '
+                'slower than baseline'.format(**regression),
+                file=sys.stderr,
+            )
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
-    print('With caching: {} usec'.format(1e6*benchmark(cache=1e5)))
-    print('Without caching: {} usec'.format(1e6*benchmark(cache=None)))
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# standard libraries
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+# third party libraries
+pass
+# first party libraries
+import bocce
+
+
+backend_names = ('cherrypy', 'asyncio')
+request = b'GET /hello HTTP/1.1\r\nHost: localhost\r\n\r\n'
+
+
+def hello(request, response, configuration):
+    response.body.text = 'Hello, world!'
+
+
+def serve(backend, port):
+    application = bocce.Application()
+    application.routes.add_handler('/hello', hello)
+    application.configure()
+    application.serve(
+        ({'host': '127.0.0.1', 'port': port, 'threads': 16}, ),
+        drop_privileges=False, backend=backend,
+    )
+
+
+def start_server(backend, port, directory):
+    # the server writes its PID file into its working directory
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', backend,
+         '--port', str(port)],
+        cwd=directory, env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30.0
+    while time.monotonic() < deadline:
+        try:
+            latencies, _ = asyncio.run(asyncio.wait_for(fetch(port, 1), 1.0))
+            if len(latencies) == 1:
+                return process
+        except (OSError, asyncio.TimeoutError):
+            pass
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('The {} server did not start.'.format(backend))
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            await reader.readexactly(int(line.split(b':', 1)[1]))
+            return
+
+
+async def fetch(port, number_requests):
+    """ Send requests over a keep-alive connection; return the latencies.
+        
+        A connection closed by the server counts as an error and is reopened.
+    
+    """
+    latencies = []
+    errors = 0
+    writer = None
+    for _ in range(number_requests):
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            await read_response(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            errors += 1
+            if writer is not None:
+                writer.close()
+                writer = None
+            continue
+        latencies.append(time.perf_counter() - start)
+    if writer is not None:
+        writer.close()
+    return latencies, errors
+
+
+async def load(port, connections, number_requests):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        fetch(port, number_requests//connections) for _ in range(connections)
+    ))
+    duration = time.perf_counter() - start
+    latencies = sorted(
+        latency for latencies, _ in results for latency in latencies
+    )
+    return {
+        'requests_per_second': len(latencies)/duration,
+        'errors': sum(errors for _, errors in results),
+        'p50_msec': 1e3*latencies[len(latencies)//2],
+        'p99_msec': 1e3*latencies[int(len(latencies)*0.99)],
+    }
+
+
+def process_status(pid):
+    status = {}
+    with open('/proc/{}/status'.format(pid), 'r') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            status[name] = value.strip()
+    return {
+        'threads': int(status['Threads']),
+        'rss_kib': int(status['VmRSS'].split()[0]),
+    }
+
+
+async def hold_idle(port, connections, pid):
+    """ Open idle keep-alive connections and report the server's footprint. """
+    writers = []
+    try:
+        for _ in range(connections):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            await read_response(reader)
+            writers.append(writer)
+        await asyncio.sleep(1.0)
+        # a thread-per-connection server can no longer answer once its pool
+        # is held by idle connections
+        try:
+            latencies, _ = await asyncio.wait_for(fetch(port, 1), 5.0)
+            responsive = len(latencies) == 1
+        except asyncio.TimeoutError:
+            responsive = False
+        footprint = process_status(pid) if os.path.exists('/proc') else {}
+        footprint['responsive'] = responsive
+        return footprint
+    finally:
+        for writer in writers:
+            writer.close()
+
+
+def benchmark(backends=backend_names, connections=(1, 16, 64),
+              number_requests=20000, idle_connections=1000, port=18080):
+    results = []
+    for backend in backends:
+        with tempfile.TemporaryDirectory() as directory:
+            process = start_server(backend, port, directory)
+            try:
+                for number_connections in connections:
+                    result = asyncio.run(
+                        load(port, number_connections, number_requests)
+                    )
+                    result.update({
+                        'backend': backend, 'connections': number_connections,
+                    })
+                    results.append(result)
+                    print(
+                        '{backend:>10} {connections:>5} connections: '
+                        '{requests_per_second:9.0f} requests/s '
+                        'p50 {p50_msec:6.2f} msec p99 {p99_msec:6.2f} msec '
+                        '{errors} errors'.format(**result),
+                        file=sys.stderr,
+                    )
+                idle = asyncio.run(hold_idle(port, idle_connections, process.pid))
+                idle.update({
+                    'backend': backend, 'idle_connections': idle_connections,
+                })
+                results.append(idle)
+                print(
+                    '{backend:>10} {idle_connections:>5} idle connections: '
+                    '{threads} threads, {rss_kib} KiB, responsive: '
+                    '{responsive}'.format(**idle),
+                    file=sys.stderr,
+                )
+            finally:
+                process.terminate()
+                process.wait()
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'results': results,
+    }
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the bocce server backends.'
+    )
+    parser.add_argument('--backends', nargs='+', default=backend_names,
+                        choices=backend_names)
+    parser.add_argument('--connections', type=int, nargs='+', default=(1, 16, 64))
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--idle-connections', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--serve', choices=backend_names, help=argparse.SUPPRESS)
+    arguments = parser.parse_args(arguments)
+    if arguments.serve is not None:
+        serve(arguments.serve, arguments.port)
+        return 0
+    report = benchmark(
+        arguments.backends, arguments.connections, arguments.requests,
+        arguments.idle_connections, arguments.port,
+    )
+    if arguments.output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(arguments.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,17 +4,20 @@ import os
 pass
 # first party libraries
 from . import (application, routing, static, surly, requests, responses, 
-               utils, cookies, exceptions, middleware, )
+               utils, cookies, exceptions, middleware, statistics, asgi, 
+               servers, timing, metrics, logs, admission, caching, )
 
 
 __where__ = os.path.dirname(os.path.abspath(__file__))
 __all__ = ('Application', 'application', 'routing', 'Route', 'Routes',
-           'Request', 'Response', 'exceptions', 'surly', 'Url')
+           'Request', 'Response', 'exceptions', 'surly', 'Url', 
+           'AsyncApplication')
 
 
 Route = routing.Route
 Routes = routing.Routes
 Application = application.Application
+AsyncApplication = asgi.AsyncApplication
 Url = surly.Url
 Request = requests.Request
 Response = responses.Response
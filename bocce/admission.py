@@ -0,0 +1,137 @@
+# standard libraries
+import os
+import heapq
+import itertools
+import threading
+# third party libraries
+pass
+# first party libraries
+pass
+
+
+__where__ = os.path.dirname(os.path.abspath(__file__))
+
+
+class AdmissionController:
+    """ Limit the requests an Application serves at once, and shed the rest.
+        
+        Up to limit requests are served concurrently; up to max_queue more
+        wait, for at most max_wait seconds, for one of them to finish. Waiting
+        requests are admitted in order of priority, lowest first, and then of
+        arrival. Requests that find the queue full or wait too long are
+        answered with a 503 rendered once, with a Retry-After header, before
+        the request is parsed or routed.
+        
+        A request's priority is that of its path, given a priority with
+        set_priority (Application.configure gives every route without
+        placeholders the priority attribute of its handler, if any), or else
+        default_priority. It is only looked up when the request has to wait.
+    
+    """
+    def __init__(self, limit=64, max_queue=256, max_wait=1.0, retry_after=1,
+                 default_priority=1, registry=None):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.default_priority = default_priority
+        self.priorities = {}
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = {}
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        content = b'The server is overloaded; please try again later.\n'
+        self.status = '503 Service Unavailable'
+        self.headers = [
+            ('Content-Type', 'text/plain; charset=utf-8'),
+            ('Content-Length', str(len(content))),
+            ('Retry-After', str(retry_after)),
+            ('Cache-Control', 'no-store'),
+        ]
+        self.content = content
+        if registry is None:
+            self._shed_counter = None
+        else:
+            self._shed_counter = registry.counter(
+                'bocce_requests_shed_total',
+                'Requests answered with 503 by admission control.',
+                ('priority', 'reason'),
+            )
+    
+    def set_priority(self, path, priority):
+        self.priorities['/' + path.lstrip('/')] = priority
+    
+    def priority(self, environment):
+        return self.priorities.get(
+            environment.get('PATH_INFO', ''), self.default_priority
+        )
+    
+    def acquire(self, environment):
+        """ Return whether the request may be served, waiting if need be. """
+        with self._lock:
+            if self.in_flight < self.limit and self.queued == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            priority = self.priority(environment)
+            if self.queued >= self.max_queue:
+                self._shed(priority, 'queue_full')
+                return False
+            # [priority, sequence, waiter, state]; the waiter is released when
+            # a finishing request hands its place over
+            waiter = threading.Lock()
+            waiter.acquire()
+            entry = [priority, next(self._sequence), waiter, 'waiting']
+            heapq.heappush(self._waiters, entry)
+            self.queued += 1
+        if waiter.acquire(timeout=self.max_wait):
+            return True
+        with self._lock:
+            # admitted between timing out and taking the lock
+            if entry[3] == 'admitted':
+                return True
+            entry[3] = 'cancelled'
+            self.queued -= 1
+            self._shed(priority, 'timeout')
+            return False
+    
+    def release(self):
+        with self._lock:
+            while len(self._waiters) > 0:
+                entry = heapq.heappop(self._waiters)
+                if entry[3] == 'cancelled':
+                    continue
+                # the place passes to the waiter, so in_flight is unchanged
+                entry[3] = 'admitted'
+                self.queued -= 1
+                self.admitted += 1
+                entry[2].release()
+                return
+            self.in_flight -= 1
+    
+    def _shed(self, priority, reason):
+        # called with the lock held
+        key = (priority, reason)
+        self.shed[key] = self.shed.get(key, 0) + 1
+        if self._shed_counter is not None:
+            self._shed_counter.inc(labels=(str(priority), reason))
+    
+    def reject(self, start_response):
+        start_response(self.status, list(self.headers))
+        return [self.content, ]
+    
+    @property
+    def statistics(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+                'admitted': self.admitted,
+                'shed': [
+                    {'priority': priority, 'reason': reason, 'count': count}
+                    for (priority, reason), count in sorted(self.shed.items())
+                ],
+            }
@@ -1,14 +1,17 @@
 # standard libraries
 import os
 import traceback
-import warnings
 import logging
+import shutil
 import signal
 import sys
+import tempfile
+import time
 # third party libraries
-import cherrypy
+pass
 # first party libraries
-from . import (routing, exceptions, requests, responses, utils, )
+from . import (routing, exceptions, requests, responses, utils, statistics, 
+               middleware, prefork, servers, timing, metrics, logs, admission, )
 
 
 __where__ = os.path.dirname(os.path.abspath(__file__))
@@ -22,65 +25,303 @@ class Application:
     def __init__(self):
         self.routes = routing.Routes()
         self.configuration = {}
+        # per-route counters; set to None to disable
+        self.statistics = statistics.Statistics()
+        self.routes.statistics = self.statistics
+        # request metrics; set to None to disable
+        self.metrics = metrics.RequestMetrics()
+        # per-phase timers; see enable_timing
+        self.timing = None
+        # concurrency limit; see enable_admission_control
+        self.admission = None
         # exceptions
         self.not_found_handler = exceptions.NotFoundHandler()
+        self.timeout_handler = exceptions.GatewayTimeoutHandler()
         self.server_error_handler = exceptions.ServerErrorHandler(debug=False)
         # logging
         self.logger = logging.getLogger('bocce')
         #self.logger.addHandler(logging.NullHandler())
         self.logger.setLevel(logging.INFO)
+        # see enable_access_log
+        self.access_log = None
+        # requests may shorten their route's timeout with this header
+        self.deadline_header = 'X-Request-Timeout'
+    
+    @property
+    def deadline_header(self):
+        return self._deadline_header
+    
+    @deadline_header.setter
+    def deadline_header(self, name):
+        self._deadline_header = name
+        if name is None:
+            self._deadline_key = None
+        else:
+            self._deadline_key = 'HTTP_{}'.format(name.upper().replace('-', '_'))
     
     def __call__(self, environment, start_response):
+        admission = self.admission
+        if admission is not None and not admission.acquire(environment):
+            return admission.reject(start_response)
+        request_metrics = self.metrics
+        if request_metrics is not None:
+            request_metrics.start_request()
+        try:
+            return self._serve(environment, start_response)
+        finally:
+            # however serving the request ends, or the slot is lost for good
+            if request_metrics is not None:
+                request_metrics.finish_request()
+            if admission is not None:
+                admission.release()
+    
+    def _serve(self, environment, start_response):
+        start = time.perf_counter()
+        route = None
+        timer = None if self.timing is None else self.timing.start(start)
+        request_metrics = self.metrics
         try:
             configuration = self.configuration
             request = self.Request.from_environment(environment)
+            if timer is not None:
+                timer.lap('parse')
             match = self.routes.match(
                 request.url.path,
                 request.http.method,
                 request.url.subdomain,
             )
+            if timer is not None:
+                timer.lap('route')
             if match is None:
                 request.route = request.segments = None
-                raise self.not_found_handler
-            request.route, request.segments = match
-            handler = request.route.handler
-            response = self.Response()
-            for before in getattr(handler, 'before', []):
-                before(request, response, configuration)
-            handler(request, response, configuration)
+                control = self.not_found_handler
+            else:
+                request.route, request.segments = match
+                # middleware is read from the route, which may share its handler
+                route = request.route
+                response = self.Response()
+                deadline = None
+                if self._deadline_key in environment or \
+                        getattr(route.handler, 'timeout', None) is not None:
+                    deadline = self._deadline(route, environment, start)
+                if timer is None and deadline is None:
+                    pipeline = route.pipeline
+                    if pipeline is None:
+                        # middleware was added since configure; recompile
+                        pipeline = route.pipeline = \
+                            self._compile_pipeline(route)
+                    # afters included
+                    afters = ()
+                    control = pipeline(request, response)
+                else:
+                    request.deadline = deadline
+                    afters = route.after
+                    control = self._run_phases(
+                        route, request, response, configuration, timer, deadline
+                    )
+            # a returned exceptions.Handler responds as if it had been raised
+            if control is not None and isinstance(control, exceptions.Handler):
+                handler = control
+                afters = getattr(handler, 'after', [])
+                response = self.Response()
+                for before in getattr(handler, 'before', []):
+                    before(request, response, configuration)
+                handler(request, response, configuration)
         except exceptions.Handler as exception:
             handler = exception
+            afters = getattr(handler, 'after', [])
             response = self.Response()
-            response.traceback = traceback.format_exc()
             for before in getattr(handler, 'before', []):
                 before(request, response, configuration)
             handler(request, response, configuration)
+            # only server errors are logged with their traceback
+            if response.status_code >= 500:
+                response.traceback = traceback.format_exc()
         except:
             handler = self.server_error_handler
+            afters = getattr(handler, 'after', [])
             response = self.Response()
             response.traceback = traceback.format_exc()
             for before in getattr(handler, 'before', []):
                 before(request, response, configuration)
-            handler(request, response, configuration, traceback.format_exc())
+            handler(request, response, configuration, response.traceback)
         finally:
-            for after in reversed(getattr(handler, 'after', [])):
+            if timer is not None:
+                timer.lap('handler')
+            for after in reversed(afters):
                 try:
                     after(request, response, configuration)
                 except:
                     continue
+            for finalizer in request.finalizers:
+                try:
+                    finalizer(request, response)
+                except:
+                    continue
+            if timer is not None:
+                timer.lap('after')
+            if self.statistics is not None:
+                self.statistics.record_response(
+                    route, response.status_code, time.perf_counter() - start
+                )
             self.log(request, response, configuration)
-            return response.start(start_response)
+            if timer is not None:
+                body = timer.start_response(request, response, start_response)
+            else:
+                body = response.start(start_response)
+            if request_metrics is not None:
+                request_metrics.record_response(
+                    route, request, response, time.perf_counter() - start
+                )
+            return body
     
-    def configure(self):
+    def _deadline(self, route, environment, start):
+        # the route's timeout, shortened by the request's header, if any
+        timeout = getattr(route.handler, 'timeout', None)
+        key = self._deadline_key
+        if key is not None and key in environment:
+            try:
+                requested_timeout = float(environment[key])
+            except ValueError:
+                requested_timeout = None
+            if requested_timeout is not None and requested_timeout >= 0.0:
+                if timeout is None or requested_timeout < timeout:
+                    timeout = requested_timeout
+        if timeout is None:
+            return None
+        return start + timeout
+    
+    def _run_phases(self, route, request, response, configuration, timer, 
+                    deadline):
+        """ Run a route's befores and handler one at a time, timing them and 
+            checking the deadline between them; return the exceptions.Handler
+            to respond with, if any.
+        
+        """
+        for before in route.before:
+            if deadline is not None and time.perf_counter() > deadline:
+                return self.timeout_handler
+            control = before(request, response, configuration)
+            if control is not None and isinstance(control, exceptions.Handler):
+                return control
+        if timer is not None:
+            timer.lap('before')
+        if deadline is not None and time.perf_counter() > deadline:
+            return self.timeout_handler
+        control = route.handler(request, response, configuration)
+        if control is not None and isinstance(control, exceptions.Handler):
+            return control
+        # the client has given up, so the afters would compress for no one
+        if deadline is not None and time.perf_counter() > deadline:
+            return self.timeout_handler
+        return None
+    
+    def configure(self, snapshot=None):
+        """ Run the configure functions, compile the pipelines and freeze the
+            routes.
+            
+            Routes cannot be added once they are frozen, so add them, and call
+            expose_statistics and expose_metrics, before configuring. The 
+            snapshot is passed to Routes.freeze.
+        
+        """
         for route in self.routes:
-            for configure in getattr(route.handler, 'configure', []):
+            for configure in route.configure:
                 configure(self.configuration)
         for configure in getattr(self.not_found_handler, 'configure', []):
             configure(self.configuration)
         for configure in getattr(self.server_error_handler, 'configure', []):
             configure(self.configuration)
+        for configure in getattr(self.timeout_handler, 'configure', []):
+            configure(self.configuration)
+        self.routes.statistics = self.statistics
+        if self.admission is not None:
+            self._set_priorities()
+        # routes sharing a handler and its middleware share one pipeline
+        pipelines = {}
+        for route in self.routes:
+            key = (id(route.handler), id(route.before), id(route.after))
+            if key not in pipelines:
+                pipelines[key] = self._compile_pipeline(route)
+            route.pipeline = pipelines[key]
+        self.routes.freeze(snapshot)
+    
+    def _set_priorities(self):
+        for route in self.routes:
+            priority = getattr(route.handler, 'priority', None)
+            # only paths without placeholders are known before routing
+            if priority is not None and '{' not in route.path and \
+                    '<' not in route.path:
+                self.admission.set_priority(route.path, priority)
+    
+    def _require_unfrozen(self, name):
+        if self.routes.frozen:
+            raise RuntimeError(
+                '{} adds a route, so call it before configure.'.format(name)
+            )
+    
+    def _compile_pipeline(self, route):
+        return middleware.pipeline(
+            route.before, route.handler, route.after, self.configuration
+        )
+    
+    def expose_statistics(self, path='/_bocce/statistics', **kwargs):
+        self._require_unfrozen('expose_statistics')
+        handler = statistics.Handler(self.statistics, self.routes)
+        return self.routes.add_handler(path, handler, share_handler=True, **kwargs)
+    
+    def expose_metrics(self, path='/metrics', **kwargs):
+        self._require_unfrozen('expose_metrics')
+        handler = metrics.Handler(self.metrics.registry)
+        return self.routes.add_handler(path, handler, share_handler=True, **kwargs)
+    
+    def enable_admission_control(self, limit=64, max_queue=256, max_wait=1.0,
+                                 retry_after=1, default_priority=1):
+        """ Serve at most limit requests at once and queue at most max_queue,
+            answering the others with 503 Service Unavailable.
+            
+            A handler's priority attribute, lowest first, orders the queue for 
+            routes without placeholders; see admission.AdmissionController. 
+            Shed requests are counted in the metrics, if enabled. Requests to
+            an AsyncApplication wait on its event loop, not in threads, and 
+            are not limited. It may be called before or after configure.
+        
+        """
+        registry = None if self.metrics is None else self.metrics.registry
+        self.admission = admission.AdmissionController(
+            limit, max_queue, max_wait, retry_after, default_priority, registry,
+        )
+        # configure has already run, so give the routes their priorities now
+        if self.routes.frozen:
+            self._set_priorities()
+        return self.admission
+    
+    def enable_timing(self, header=True, sink=None):
+        """ Time parsing, routing, before middleware, the handler, after 
+            middleware and serialization of every request.
+            
+            The durations are sent as a Server-Timing header, if header is
+            true, and passed to sink(request, response, durations); see
+            timing.Timing. Timed requests bypass the compiled pipelines, so
+            leave timing disabled, as it is by default, where every 
+            microsecond counts.
+        
+        """
+        self.timing = timing.Timing(header, sink)
+        return self.timing
+    
+    def disable_timing(self):
+        self.timing = None
     
     def log(self, request, response, configuration):
+        access_log = self.access_log
+        if access_log is not None:
+            status_code = response.status_code
+            access_log.record(
+                status_code, request.http.method, '/{}'.format(request.url.path),
+                getattr(response, 'traceback', '') if status_code >= 500 else None,
+            )
+            return
         # collect details from request, response, and exception traceback (if any)
         http_details = '{} {} {} {}'.format(
             utils.When.timestamp(),
@@ -109,6 +350,17 @@ class Application:
         handler.setLevel(level)
         self.logger.addHandler(handler)
     
+    def enable_access_log(self, stream=None, format='text', **kwargs):
+        """ Log requests from a background thread instead of the request's.
+            
+            Lines are written to stream, if given, or else to the logger as
+            log would; format 'json' writes one JSON object per request. See 
+            logs.AccessLog for the other arguments.
+        
+        """
+        self.access_log = logs.AccessLog(stream, self.logger, format, **kwargs)
+        return self.access_log
+    
     def daemonize(self, stdin=os.devnull, stdout=os.devnull, stderr=os.devnull):
         sys.stdout.flush()
         sys.stderr.flush()
@@ -131,17 +383,33 @@ class Application:
         os.dup2(stdout.fileno(), sys.stdout.fileno())
         os.dup2(stderr.fileno(), sys.stderr.fileno())
         
-    def serve(self, interfaces=({'host': '127.0.0.1', 'port': 8080}, ), drop_privileges=True):
+    def serve(self, interfaces=({'host': '127.0.0.1', 'port': 8080}, ), 
+              drop_privileges=True, workers=None, reuse_port=False, 
+              backend='cherrypy', graceful_timeout=30.0):
+        """ Serve the application on the given interfaces.
+            
+            The backend is a servers.Backend or the name of one in 
+            servers.backends: cherrypy's thread pool, or asyncio's event loop.
+            With workers=N the listening sockets are bound once and N worker
+            processes are forked to accept on them; with reuse_port each worker 
+            binds its own socket with SO_REUSEPORT and the kernel balances 
+            connections between them. The master restarts crashed workers and
+            writes its PID to PID and each worker's to PID.<index>.
+            
+            Sending the master SIGHUP replaces the workers, and SIGUSR2 
+            re-executes it to load new code, without closing the listening 
+            sockets (see prefork.Supervisor); old workers stop once their
+            replacements serve, and get graceful_timeout seconds to finish 
+            their requests. The application is configured before forking, if
+            it has not been, so new workers start warm. Each worker's metrics
+            are written to a shared directory and summed by expose_metrics.
         
-        if tuple(cherrypy.__version__.split('.')) < ('3', '8', '0'):
-            warnings.warn(
-                'Upgrade to a newer version of cherrypy (> v3.8.0) to avoid '
-                'buggy behavior.'
-            )
+        """
+        if isinstance(backend, str):
+            backend = servers.backends[backend]()
+        if not self.routes.frozen:
+            self.configure()
         
-        cherrypy.tree.graft(self, '/')
-        cherrypy.server.unsubscribe()
-
         when = utils.When.timestamp()
         pid = str(os.getpid())
         self.logger.info(
@@ -149,46 +417,73 @@ class Application:
                 when, pid
             )
         )
-        
-        with open('PID', 'wb') as f:
-            f.write(pid.encode('ascii'))
-        
         for interface in interfaces:
-            host = interface.get('host', '127.0.0.1')
-            port = interface.get('port', 8080)
-            threads = interface.get('threads', 16)
-            ssl_certificate = interface.get('ssl_certificate', None)
-            ssl_private_key = interface.get('ssl_private_key', None)
-            
-            self.logger.info('    {}:{}'.format(host, port))
-            server = cherrypy._cpserver.Server()
-            server.socket_host = host
-            server.socket_port = port
-            server.thread_pool = threads
-            
-            if ssl_certificate is not None and ssl_private_key is not None:
-                server.ssl_module = 'builtin'
-                server.ssl_certificate = ssl_certificate
-                server.ssl_private_key = ssl_private_key
-            
-            server.subscribe()
+            self.logger.info('    {}:{}'.format(
+                interface.get('host', '127.0.0.1'), interface.get('port', 8080)
+            ))
         
-        cherrypy.log.access_log.setLevel(logging.ERROR)
-        cherrypy.log.error_log.setLevel(logging.ERROR)
-        cherrypy.engine.autoreload.unsubscribe()
-
-        if drop_privileges:
-            uid = int(os.environ['SUDO_UID'])
-            gid = int(os.environ['SUDO_GID'])
-            if uid == 0:
-                uid = 1000
-            if gid == 0:
-                gid = 1000
-            cherrypy.process.plugins.DropPrivileges(cherrypy.engine, uid=uid, gid=gid).subscribe()
-
+        if workers is None:
+            prefork.write_pid('PID', pid)
+            try:
+                backend.serve(
+                    self, interfaces, None, drop_privileges, graceful_timeout
+                )
+            finally:
+                if self.access_log is not None:
+                    self.access_log.close()
+                when = utils.When.timestamp()
+                self.logger.info('Server stopped at {}.'.format(when))
+            return
+        
+        # a re-executed master inherits the listeners of the one it replaces
+        listeners = prefork.inherited_listeners()
+        if reuse_port:
+            listeners = None
+        elif listeners is None:
+            listeners = [
+                prefork.listen(
+                    interface.get('host', '127.0.0.1'), 
+                    interface.get('port', 8080),
+                )
+                for interface in interfaces
+            ]
+        def work(index):
+            if reuse_port:
+                worker_listeners = [
+                    prefork.listen(
+                        interface.get('host', '127.0.0.1'), 
+                        interface.get('port', 8080),
+                        reuse_port=True,
+                    )
+                    for interface in interfaces
+                ]
+            else:
+                worker_listeners = listeners
+            try:
+                backend.serve(
+                    self, interfaces, worker_listeners, drop_privileges, 
+                    graceful_timeout,
+                )
+            finally:
+                if self.metrics is not None:
+                    self.metrics.registry.write()
+                if self.access_log is not None:
+                    self.access_log.close()
+                when = utils.When.timestamp()
+                self.logger.info('Server stopped at {}.'.format(when))
+        # workers share their metrics through files, unless told where already
+        metrics_directory = None
+        if self.metrics is not None and self.metrics.registry.directory is None:
+            metrics_directory = tempfile.mkdtemp(prefix='bocce-metrics-')
+            self.metrics.registry.directory = metrics_directory
+        supervisor = prefork.Supervisor(
+            work, workers, 'PID', graceful_timeout=graceful_timeout, 
+            listeners=listeners or (), logger=self.logger,
+        )
         try:
-            cherrypy.engine.start()
-            cherrypy.engine.block()
+            supervisor.run()
         finally:
+            if metrics_directory is not None:
+                shutil.rmtree(metrics_directory, ignore_errors=True)
             when = utils.When.timestamp()
-            self.logger.info('Server stopped at {}.'.format(when))
+            self.logger.info('Supervisor stopped at {}.'.format(when))
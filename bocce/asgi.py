@@ -0,0 +1,289 @@
+# standard libraries
+import os
+import asyncio
+import concurrent.futures
+import inspect
+import io
+import sys
+import time
+import traceback
+# third party libraries
+pass
+# first party libraries
+from . import (application, exceptions, middleware, responses, )
+
+
+__where__ = os.path.dirname(os.path.abspath(__file__))
+
+
+def is_async(function):
+    return (
+        inspect.iscoroutinefunction(function) or
+        inspect.iscoroutinefunction(getattr(function, '__call__', None))
+    )
+
+
+async def call(function, request, response, configuration):
+    if is_async(function):
+        return await function(request, response, configuration)
+    return function(request, response, configuration)
+
+
+def pipeline(befores, handler, afters, configuration, executor):
+    """ The asynchronous counterpart of middleware.pipeline.
+        
+        Coroutine functions are awaited; a synchronous handler is run in the
+        executor, while synchronous middleware, which is expected to be cheap,
+        is run on the event loop. A returned exceptions.Handler is returned.
+    
+    """
+    befores = tuple(
+        (before, is_async(before))
+        for before in (middleware.bind(b, configuration) for b in befores)
+        if before is not None
+    )
+    afters = tuple(
+        (after, is_async(after))
+        for after in (middleware.bind(a, configuration) for a in reversed(afters))
+        if after is not None
+    )
+    handler_is_async = is_async(handler)
+    Handler = exceptions.Handler
+    async def run(request, response):
+        for before, before_is_async in befores:
+            if before_is_async:
+                control = await before(request, response, configuration)
+            else:
+                control = before(request, response, configuration)
+            if control is not None and isinstance(control, Handler):
+                return control
+        if handler_is_async:
+            control = await handler(request, response, configuration)
+        else:
+            control = await asyncio.get_running_loop().run_in_executor(
+                executor, handler, request, response, configuration
+            )
+        if control is not None and isinstance(control, Handler):
+            return control
+        for after, after_is_async in afters:
+            try:
+                if after_is_async:
+                    await after(request, response, configuration)
+                else:
+                    after(request, response, configuration)
+            except Exception:
+                continue
+    return run
+
+
+async def read_body(receive):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionResetError('The client disconnected.')
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+def environment_from_scope(scope, body):
+    """ Build a WSGI environment from an ASGI HTTP scope and request body. """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environment = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_{}'.format(name.upper().replace('-', '_'))
+        if key in environment:
+            separator = '; ' if key == 'HTTP_COOKIE' else ','
+            environment[key] = '{}{}{}'.format(environment[key], separator, value)
+        else:
+            environment[key] = value
+    # the body is buffered, so its length is known even if it was chunked
+    environment['CONTENT_LENGTH'] = str(len(body))
+    return environment
+
+
+class AsyncApplication(application.Application):
+    """ An ASGI application sharing routes, requests, responses and exception
+        handlers with the WSGI Application.
+        
+        Handlers and middleware may be coroutine functions. Synchronous
+        handlers are run in a thread pool of at most threads workers, so an
+        event loop can hold many slow requests while only blocking handlers
+        take a thread. Request bodies are read in full before dispatch.
+    
+    """
+    def __init__(self, threads=32):
+        super().__init__()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            threads, thread_name_prefix='bocce',
+        )
+    
+    def _compile_pipeline(self, route):
+        return pipeline(
+            route.before, route.handler, route.after, self.configuration,
+            self.executor,
+        )
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            request_metrics = self.metrics
+            if request_metrics is None:
+                await self._serve_http(scope, receive, send)
+                return
+            request_metrics.start_request()
+            try:
+                await self._serve_http(scope, receive, send)
+            finally:
+                # however serving the request ends
+                request_metrics.finish_request()
+        elif scope['type'] == 'lifespan':
+            await self._serve_lifespan(receive, send)
+        else:
+            raise NotImplementedError(
+                'Unsupported ASGI scope type {}.'.format(scope['type'])
+            )
+    
+    async def _serve_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    async def _serve_http(self, scope, receive, send):
+        start = time.perf_counter()
+        route = None
+        configuration = self.configuration
+        environment = environment_from_scope(scope, await read_body(receive))
+        request = self.Request.from_environment(environment)
+        request_metrics = self.metrics
+        try:
+            match = self.routes.match(
+                request.url.path,
+                request.http.method,
+                request.url.subdomain,
+            )
+            if match is None:
+                request.route = request.segments = None
+                control = self.not_found_handler
+            else:
+                request.route, request.segments = match
+                route = request.route
+                # for request.remaining; the deadline is not enforced here
+                request.deadline = self._deadline(route, environment, start)
+                response = self.Response()
+                afters = ()
+                pipeline = route.pipeline
+                if pipeline is None:
+                    # configure was not called; compile on first use
+                    pipeline = route.pipeline = self._compile_pipeline(route)
+                control = await pipeline(request, response)
+            if control is not None and isinstance(control, exceptions.Handler):
+                handler = control
+                afters = getattr(handler, 'after', [])
+                response = self.Response()
+                for before in getattr(handler, 'before', []):
+                    await call(before, request, response, configuration)
+                await call(handler, request, response, configuration)
+        except exceptions.Handler as exception:
+            handler = exception
+            afters = getattr(handler, 'after', [])
+            response = self.Response()
+            for before in getattr(handler, 'before', []):
+                await call(before, request, response, configuration)
+            await call(handler, request, response, configuration)
+            if response.status_code >= 500:
+                response.traceback = traceback.format_exc()
+        except Exception:
+            handler = self.server_error_handler
+            afters = getattr(handler, 'after', [])
+            response = self.Response()
+            response.traceback = traceback.format_exc()
+            for before in getattr(handler, 'before', []):
+                await call(before, request, response, configuration)
+            handler(request, response, configuration, response.traceback)
+        for after in reversed(afters):
+            try:
+                await call(after, request, response, configuration)
+            except Exception:
+                continue
+        for finalizer in request.finalizers:
+            try:
+                finalizer(request, response)
+            except Exception:
+                continue
+        if self.statistics is not None:
+            self.statistics.record_response(
+                route, response.status_code, time.perf_counter() - start
+            )
+        self.log(request, response, configuration)
+        await self._send_response(response, send)
+        if request_metrics is not None:
+            request_metrics.record_response(
+                route, request, response, time.perf_counter() - start
+            )
+    
+    async def _send_response(self, response, send):
+        started = {}
+        def start_response(status, headers):
+            started['headers'] = headers
+        body = response.start(start_response)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in started['headers']
+            ],
+        })
+        iterator = iter(body)
+        if isinstance(body._iterable, responses.BodyIterable):
+            # files and arbitrary iterables may block, so read them in the pool
+            loop = asyncio.get_running_loop()
+            while True:
+                chunk = await loop.run_in_executor(
+                    self.executor, next, iterator, None
+                )
+                if chunk is None:
+                    break
+                await send({
+                    'type': 'http.response.body', 'body': chunk,
+                    'more_body': True,
+                })
+        else:
+            for chunk in iterator:
+                await send({
+                    'type': 'http.response.body', 'body': chunk,
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body', 'body': b''})
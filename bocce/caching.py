@@ -0,0 +1,521 @@
+# standard libraries
+import os
+import collections
+import concurrent.futures
+import copy
+import threading
+import time
+import weakref
+# third party libraries
+pass
+# first party libraries
+from . import (exceptions, middleware, responses, )
+
+
+__where__ = os.path.dirname(os.path.abspath(__file__))
+
+
+cacheable_methods = frozenset(('GET', 'HEAD', ))
+cacheable_status_codes = frozenset((200, 203, 204, 300, 301, 404, 410, ))
+# identify the client; requests carrying them are only shared with requests
+# carrying the same values, which needs them to be part of the key
+credential_headers = ('Authorization', 'Cookie', )
+# set from the body, or never cached
+_excluded_headers = frozenset((
+    'Content-Type', 'Content-Length', 'Content-Encoding', 'Set-Cookie',
+))
+
+
+class CachedResponse:
+    
+    __slots__ = (
+        'status_code', 'headers', 'content', 'content_type', 'content_encoding',
+        'created', 'expires', 'route', 'path', 'vary', 'size',
+    )
+    
+    def __init__(self, status_code, headers, content, content_type,
+                 content_encoding, created, expires, route, path, vary=()):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.created = created
+        self.expires = expires
+        self.route = route
+        self.path = path
+        # the request headers named by the response's Vary header
+        self.vary = vary
+        # roughly what the entry holds in memory
+        self.size = 256 + len(content) + sum(
+            len(name) + len(value) for name, value in headers
+        )
+
+
+class CachedResponseHandler(exceptions.Handler):
+    
+    def __init__(self, entry, age=True):
+        super(CachedResponseHandler, self).__init__()
+        self.entry = entry
+        self.age = age
+    
+    def __call__(self, request, response, configuration):
+        entry = self.entry
+        response.status_code = entry.status_code
+        for name, value in entry.headers:
+            response.headers[name] = value
+        if self.age:
+            response.headers['Age'] = int(time.monotonic() - entry.created)
+        response.body.set_content(
+            entry.content, entry.content_type, entry.content_encoding
+        )
+
+
+def _header_value(request, name):
+    value = request.headers.get(name)
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def primary_key(request, headers=()):
+    return (
+        request.http.method, str(request.url),
+        'gzip' in request.accept.encodings,
+    ) + tuple(_header_value(request, name) for name in headers)
+
+
+def vary_key(request, vary):
+    return tuple(_header_value(request, name) for name in vary)
+
+
+def shareable(request, headers=()):
+    """ Return whether the response to request may be shared with requests
+        with the same values of the given headers.
+        
+        Only responses to GET and HEAD, without credential headers other than
+        those given, may be.
+    
+    """
+    if request.http.method not in cacheable_methods:
+        return False
+    for name in credential_headers:
+        if request.headers.get(name) is not None and \
+                name not in headers and name.lower() not in headers:
+            return False
+    return True
+
+
+def capture(request, response, ttl=0.0, headers=()):
+    """ Return a CachedResponse of response, as it will be sent, or None if
+        it may not be shared with other requests.
+        
+        Only responses to requests shareable accepts, with a cacheable status
+        code, a body held in memory, no cookies, no Cache-Control of no-store
+        or private and no Vary of * may be.
+    
+    """
+    if not shareable(request, headers) or \
+            response.status_code not in cacheable_status_codes:
+        return None
+    body = response.body
+    if isinstance(body._iterable, responses.BodyIterable) or \
+            len(response.cookies) > 0:
+        return None
+    cache_control = ','.join(response.headers.get('Cache-Control', default=[]))
+    if 'no-store' in cache_control or 'private' in cache_control:
+        return None
+    vary = tuple(
+        name.strip().title()
+        for value in response.headers.get('Vary', default=[])
+        for name in value.split(',') if name.strip()
+    )
+    if '*' in vary:
+        return None
+    stored_headers = [
+        (name, value) for name, value in response.headers
+        if name not in _excluded_headers
+    ]
+    now = time.monotonic()
+    return CachedResponse(
+        response.status_code, stored_headers, b''.join(body),
+        body.content_type, body.content_encoding, now, now + ttl,
+        request.route, '/{}'.format(request.url.path), vary,
+    )
+
+
+class ResponseCache:
+    """ Cache whole responses, as sent, in memory.
+        
+        install appends to a route's befores one which answers a request from
+        the cache, after the route's other befores (such as authentication)
+        but before the handler runs, and adds an after middleware, run
+        after the route's other afters (so after compression), which stores
+        the response for ttl seconds. Entries are keyed on the method, the
+        url, whether the client accepts gzip, the values of the route's
+        headers and of those named in the response's Vary header. They are
+        evicted least recently used first once they take more than max_bytes.
+        Only responses capture accepts are cached, so requests carrying
+        Authorization or Cookie headers neither use nor fill the cache unless
+        those headers are part of the key.
+        
+        An entry expired for less than the route's stale_while_revalidate
+        seconds is still served, while the route's befores (but the lookup),
+        handler and afters run again in the background to refresh it, at most
+        once per entry at a time and refresh_workers at once. An entry expired
+        for less than stale_if_error seconds is served instead of a response
+        with a server error status, including that of an exception.
+    
+    """
+    def __init__(self, max_bytes=64*2**20, registry=None, refresh_workers=2):
+        self.max_bytes = max_bytes
+        self.refresh_workers = refresh_workers
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.stale_errors = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = collections.OrderedDict()
+        # the request headers named by the Vary header of each route's responses
+        self._vary = {}
+        # the keys of the entries being refreshed
+        self._refreshing = set()
+        self._executor = None
+        self._lock = threading.Lock()
+        reference = weakref.ref(self)
+        def after_fork():
+            cache = reference()
+            if cache is not None:
+                cache._after_fork()
+        os.register_at_fork(after_in_child=after_fork)
+        if registry is None:
+            self._lookups = None
+        else:
+            self._lookups = registry.counter(
+                'bocce_response_cache_lookups_total',
+                'Response cache lookups by result.', ('result', ),
+            )
+    
+    def install(self, route, ttl=60.0, headers=(), stale_while_revalidate=0.0,
+                stale_if_error=0.0):
+        """ Cache the responses of route for ttl seconds, keyed also on the
+            values of the given request headers.
+        
+        """
+        headers = tuple(headers)
+        def lookup(request, response, configuration):
+            return self.lookup(
+                request, headers, stale_while_revalidate, stale_if_error,
+                configuration,
+            )
+        def store(request, response, configuration):
+            self.store(request, response, headers, ttl)
+        # for _refresh to leave out
+        lookup.cache = self
+        route.add_to_before(lookup, len(route.before))
+        route.add_to_after(store, 0)
+        return route
+    
+    def _key(self, request, headers, vary):
+        key = primary_key(request, headers)
+        if len(vary) == 0:
+            return key
+        return key + vary_key(request, vary)
+    
+    def lookup(self, request, headers=(), stale_while_revalidate=0.0,
+               stale_if_error=0.0, configuration=None):
+        """ Return a handler responding with the cached response, or None. """
+        if not shareable(request, headers):
+            return None
+        key = self._key(request, headers, self._vary.get(request.route, ()))
+        now = time.monotonic()
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                result = 'miss'
+            elif entry.expires > now:
+                result = 'hit'
+            elif now - entry.expires < stale_while_revalidate:
+                result = 'stale'
+                refresh = key not in self._refreshing
+                if refresh:
+                    self._refreshing.add(key)
+            elif now - entry.expires < stale_if_error:
+                # kept in case the handler fails
+                result = 'miss'
+            else:
+                self._remove(key)
+                result = 'miss'
+            if result == 'miss':
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                if result == 'hit':
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+        if self._lookups is not None:
+            self._lookups.inc(labels=(result, ))
+        if result == 'hit':
+            return CachedResponseHandler(entry)
+        if result == 'stale':
+            if refresh:
+                self._submit_refresh(key, request, configuration)
+            return CachedResponseHandler(entry)
+        if entry is not None:
+            def serve_stale_on_error(request, response):
+                if response.status_code >= 500:
+                    self._serve_stale(entry, request, response)
+            request.add_finalizer(serve_stale_on_error)
+        return None
+    
+    def _serve_stale(self, entry, request, response):
+        with self._lock:
+            self.stale_errors += 1
+        # start over from an empty response
+        response.__init__()
+        CachedResponseHandler(entry)(request, response, {})
+    
+    def _submit_refresh(self, key, request, configuration):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.refresh_workers,
+                    thread_name_prefix='bocce-cache-refresh',
+                )
+            executor = self._executor
+        # the request is answered from the cache; refresh with a copy of it
+        refresh_request = copy.copy(request)
+        refresh_request.deadline = None
+        refresh_request.finalizers = ()
+        try:
+            executor.submit(
+                self._refresh, key, refresh_request, configuration or {}
+            )
+        except RuntimeError:
+            # shut down
+            with self._lock:
+                self._refreshing.discard(key)
+    
+    def _refresh(self, key, request, configuration):
+        route = request.route
+        response = responses.Response()
+        try:
+            # the afters include store, which replaces the entry
+            run = middleware.pipeline(
+                [before for before in route.before
+                 if getattr(before, 'cache', None) is not self],
+                route.handler, route.after, configuration,
+            )
+            control = run(request, response)
+            if control is not None and isinstance(control, exceptions.Handler):
+                raise control
+        except Exception:
+            response = responses.Response()
+            response.status_code = 500
+            with self._lock:
+                self.refresh_failures += 1
+        else:
+            with self._lock:
+                self.refreshes += 1
+        finally:
+            for finalizer in request.finalizers:
+                try:
+                    finalizer(request, response)
+                except Exception:
+                    continue
+            with self._lock:
+                self._refreshing.discard(key)
+    
+    def _after_fork(self):
+        # the parent's refresh threads did not survive
+        self._executor = None
+        self._refreshing = set()
+        self._lock = threading.Lock()
+    
+    def store(self, request, response, headers=(), ttl=60.0):
+        entry = capture(request, response, ttl, headers)
+        if entry is None or entry.size > self.max_bytes:
+            return
+        self._vary[request.route] = entry.vary
+        key = self._key(request, headers, entry.vary)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def _remove(self, key):
+        # called with the lock held
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+    
+    def invalidate(self, route=None, path=None):
+        """ Remove the entries of a route, or for a path, or else all of them;
+            return how many were removed.
+        
+        """
+        with self._lock:
+            keys = [
+                key for key, entry in self._entries.items()
+                if (route is None or entry.route is route) and
+                   (path is None or entry.path == '/' + path.lstrip('/'))
+            ]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+    
+    @property
+    def statistics(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'hit_ratio': (
+                    (self.hits + self.stale_hits)/float(lookups)
+                    if lookups > 0 else None
+                ),
+                'stale_errors': self.stale_errors,
+                'refreshes': self.refreshes,
+                'refresh_failures': self.refresh_failures,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'length': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class Flight:
+    
+    __slots__ = ('landed', 'entry', 'vary_key', )
+    
+    def __init__(self):
+        self.landed = threading.Event()
+        self.entry = None
+        self.vary_key = None
+
+
+class Coalescer:
+    """ Let concurrent identical requests share one run of their handler.
+        
+        install appends to a route's befores one that, for requests shareable
+        accepts, looks for a request with the same key (as ResponseCache's,
+        without Vary) being served. If there is none, the request becomes the
+        leader and is served as usual; otherwise it waits, for at most timeout
+        seconds or what remains of its deadline, and is answered with the
+        leader's final response, afters included, sharing its body. A request
+        which waits too long, whose leader's response capture refuses, or
+        whose headers named by that response's Vary header differ from the
+        leader's, is served by the handler after all. Requests carrying
+        Authorization or Cookie headers are not coalesced unless those headers
+        are part of the key.
+        
+        The wait blocks its thread, so install it on routes served by
+        Application rather than AsyncApplication. Install a ResponseCache on
+        the same route first, so it answers from the cache before any wait.
+    
+    """
+    def __init__(self, timeout=5.0, registry=None):
+        self.timeout = timeout
+        self.leaders = 0
+        self.shared = 0
+        self.fallbacks = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+        if registry is None:
+            self._requests = None
+        else:
+            self._requests = registry.counter(
+                'bocce_coalesced_requests_total',
+                'Requests to coalescing routes by how they were served.',
+                ('result', ),
+            )
+    
+    def install(self, route, headers=()):
+        """ Coalesce the requests to route, keyed also on the values of the
+            given request headers.
+        
+        """
+        headers = tuple(headers)
+        def coalesce(request, response, configuration):
+            return self.coalesce(request, headers)
+        route.add_to_before(coalesce, len(route.before))
+        return route
+    
+    def coalesce(self, request, headers=()):
+        """ Return a handler responding with the leader's response, or None
+            to serve the request.
+        
+        """
+        if not shareable(request, headers):
+            return None
+        key = primary_key(request, headers)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+                leader = True
+            else:
+                leader = False
+        if leader:
+            def land(request, response):
+                self._land(key, flight, request, response, headers)
+            request.add_finalizer(land)
+            self._count('leader')
+            return None
+        timeout = self.timeout
+        remaining = request.remaining()
+        if remaining is not None and remaining < timeout:
+            timeout = remaining
+        if flight.landed.wait(timeout):
+            entry = flight.entry
+            if entry is not None and \
+                    flight.vary_key == vary_key(request, entry.vary):
+                with self._lock:
+                    self.shared += 1
+                self._count('shared')
+                return CachedResponseHandler(entry, age=False)
+        with self._lock:
+            self.fallbacks += 1
+        self._count('fallback')
+        return None
+    
+    def _land(self, key, flight, request, response, headers):
+        try:
+            entry = capture(request, response, headers=headers)
+            if entry is not None:
+                flight.vary_key = vary_key(request, entry.vary)
+                flight.entry = entry
+        finally:
+            # even if the response cannot be captured, or the key is stuck
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.landed.set()
+    
+    def _count(self, result):
+        if self._requests is not None:
+            self._requests.inc(labels=(result, ))
+    
+    @property
+    def statistics(self):
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'shared': self.shared,
+                'fallbacks': self.fallbacks,
+                'in_flight': len(self._flights),
+            }
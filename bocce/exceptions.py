@@ -52,7 +52,13 @@ def format_template(**kwargs):
 
 
 class Handler(Exception, metaclass=abc.ABCMeta):
+    """ A handler for responses that stop a request early.
+        
+        Raise one from a route's handler or before middleware, or, more
+        cheaply, return it: the Application responds with it instead, with a
+        new Response, running its own before and after middleware, if any.
     
+    """
     def __init__(self):
         super(Handler, self).__init__()
     
@@ -72,6 +78,17 @@ class NotFoundHandler(Handler):
         )
 
 
+class GatewayTimeoutHandler(Handler):
+    
+    def __call__(self, request, response, configuration):
+        response.status_code = 504
+        message = 'The request for /{} could not be answered within its deadline.'
+        message = message.format(request.url.path)
+        response.body.html = format_template(
+            status=response.status, message=message, traceback=''
+        )
+
+
 class ServerErrorHandler(Handler):
     
     def __init__(self, debug=False):
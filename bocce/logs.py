@@ -0,0 +1,171 @@
+# standard libraries
+import os
+import collections
+import json
+import logging
+import threading
+import time
+import weakref
+# third party libraries
+pass
+# first party libraries
+pass
+
+
+__where__ = os.path.dirname(os.path.abspath(__file__))
+
+
+class AccessLog:
+    """ Write access log lines from a background thread, in batches.
+        
+        record only appends a tuple to a deque, which needs no lock; every
+        interval seconds, or as soon as batch_size records are pending, the
+        writer formats the pending records and writes them to stream, flushing
+        once per batch, or, without a stream, passes them to logger. At most
+        max_pending records wait; further ones are dropped and counted in
+        dropped, and the writer reports how many it lost. Records are
+        formatted as Application.log formats them or, if format is 'json', as
+        one JSON object per line.
+        
+        Call close, as Application.serve does, to write what is pending before
+        the process exits.
+    
+    """
+    def __init__(self, stream=None, logger=None, format='text',
+                 max_pending=65536, batch_size=1024, interval=0.1):
+        if format not in ('text', 'json'):
+            raise ValueError('Unknown access log format {}.'.format(format))
+        if logger is None:
+            logger = logging.getLogger('bocce')
+        self.stream = stream
+        self.logger = logger
+        self.format = format
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._pending = collections.deque()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._writer = None
+        self._closed = False
+        self._second = None
+        self._timestamp = None
+        reference = weakref.ref(self)
+        def after_fork():
+            access_log = reference()
+            if access_log is not None:
+                access_log._after_fork()
+        os.register_at_fork(after_in_child=after_fork)
+    
+    def record(self, status_code, method, path, traceback=None):
+        pending = self._pending
+        if len(pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        pending.append((time.time(), status_code, method, path, traceback))
+        if self._writer is None:
+            self._start()
+        elif len(pending) == self.batch_size:
+            self._wakeup.set()
+    
+    def _start(self):
+        with self._flush_lock:
+            if self._writer is not None or self._closed:
+                return
+            self._writer = threading.Thread(
+                target=self._write, name='bocce-access-log', daemon=True,
+            )
+            self._writer.start()
+    
+    def _after_fork(self):
+        # the parent's writer did not survive, and its records are its own
+        self._writer = None
+        self._pending.clear()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+    
+    def _write(self):
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # a broken stream must not stop the writer
+                continue
+    
+    def flush(self):
+        with self._flush_lock:
+            pending = self._pending
+            while len(pending) > 0:
+                batch = []
+                try:
+                    for _ in range(self.batch_size):
+                        batch.append(pending.popleft())
+                except IndexError:
+                    pass
+                self._emit(batch)
+            dropped = self.dropped
+            if dropped > self._reported_dropped:
+                self.logger.warning(
+                    'Dropped {} access log records.'.format(
+                        dropped - self._reported_dropped
+                    )
+                )
+                self._reported_dropped = dropped
+    
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+    
+    def timestamp(self, when):
+        second = int(when)
+        if second != self._second:
+            self._timestamp = time.strftime(
+                '%Y-%m-%dT%H:%M:%SZ', time.gmtime(second)
+            )
+            self._second = second
+        return self._timestamp
+    
+    def format_record(self, record):
+        when, status_code, method, path, traceback = record
+        if self.format == 'json':
+            fields = {
+                'time': self.timestamp(when),
+                'status': status_code,
+                'method': method,
+                'path': path,
+            }
+            if traceback is not None:
+                fields['traceback'] = traceback
+            return json.dumps(fields)
+        line = '{} {} {} {}'.format(
+            self.timestamp(when), status_code, method.ljust(7), path,
+        )
+        if traceback is None:
+            return line
+        formatted_traceback = '\n'.join(
+            '    ' + traceback_line for traceback_line in traceback.splitlines()
+            if traceback_line.strip()
+        )
+        return '{}\n\n{}\n'.format(line, formatted_traceback)
+    
+    def _emit(self, batch):
+        if self.stream is not None:
+            self.stream.write(''.join(
+                self.format_record(record) + '\n' for record in batch
+            ))
+            self.stream.flush()
+            return
+        for record in batch:
+            status_code = record[1]
+            if status_code < 400:
+                level = logging.INFO
+            elif status_code < 500:
+                level = logging.WARNING
+            else:
+                level = logging.ERROR
+            self.logger.log(level, self.format_record(record))
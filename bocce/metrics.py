@@ -0,0 +1,431 @@
+# standard libraries
+import os
+import array
+import bisect
+import json
+import threading
+import time
+import weakref
+# third party libraries
+pass
+# first party libraries
+from . import statistics
+
+
+__where__ = os.path.dirname(os.path.abspath(__file__))
+
+
+latency_buckets = statistics.latency_buckets
+size_buckets = (
+    100.0, 1000.0, 10000.0, 100000.0, 1000000.0, 10000000.0, float('inf'),
+)
+ratio_buckets = (
+    0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, float('inf'),
+)
+content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_number(number):
+    if number == float('inf'):
+        return '+Inf'
+    if number == float('-inf'):
+        return '-Inf'
+    if number == int(number):
+        return str(int(number))
+    return repr(number)
+
+
+def format_labels(names, values):
+    if len(names) == 0:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                                         .replace('\n', r'\n')
+                                         .replace('"', r'\"'))
+        for name, value in zip(names, values)
+    ))
+
+
+class Metric:
+    """ A named metric holding, for every tuple of label values, an array of
+        size floats.
+        
+        As in statistics.Statistics, every thread updates its own arrays, kept
+        in statistics.Accumulators, so recording takes no lock; collect sums
+        the arrays of all threads.
+    
+    """
+    type = 'untyped'
+    
+    def __init__(self, name, help='', labels=(), size=1):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.size = size
+        self._accumulators = statistics.Accumulators()
+    
+    def _values(self, labels):
+        accumulator = self._accumulators.get()
+        try:
+            return accumulator[labels]
+        except KeyError:
+            values = accumulator[labels] = array.array('d', [0.0]*self.size)
+            return values
+    
+    def reset(self):
+        self._accumulators.reset()
+    
+    def collect(self):
+        """ Return the sums of every thread's values, keyed by label values. """
+        samples = {}
+        for accumulator in self._accumulators.all():
+            for labels, values in list(accumulator.items()):
+                totals = samples.get(labels)
+                if totals is None:
+                    samples[labels] = list(values)
+                else:
+                    for index, value in enumerate(values):
+                        totals[index] += value
+        return samples
+    
+    def describe(self):
+        return {'type': self.type, 'help': self.help, 'labels': self.labels}
+    
+    def exposition(self, samples):
+        lines = [
+            '# HELP {} {}'.format(
+                self.name, self.help.replace('\\', r'\\').replace('\n', r'\n')
+            ),
+            '# TYPE {} {}'.format(self.name, self.type),
+        ]
+        for labels, values in sorted(samples.items()):
+            lines.append('{}{} {}'.format(
+                self.name, format_labels(self.labels, labels),
+                format_number(values[0]),
+            ))
+        return lines
+
+
+class Counter(Metric):
+    
+    type = 'counter'
+    
+    def inc(self, amount=1.0, labels=()):
+        self._values(labels)[0] += amount
+
+
+class Gauge(Metric):
+    """ A value that goes up and down.
+        
+        inc and dec are recorded per thread like a counter's; set, which
+        takes a lock, records the offset from their sum.
+    
+    """
+    type = 'gauge'
+    
+    def __init__(self, name, help='', labels=()):
+        super(Gauge, self).__init__(name, help, labels)
+        self._offsets = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1.0, labels=()):
+        self._values(labels)[0] += amount
+    
+    def dec(self, amount=1.0, labels=()):
+        self._values(labels)[0] -= amount
+    
+    def set(self, value, labels=()):
+        total = super(Gauge, self).collect().get(labels, [0.0])[0]
+        with self._lock:
+            self._offsets[labels] = value - total
+    
+    def reset(self):
+        super(Gauge, self).reset()
+        with self._lock:
+            self._offsets = {}
+    
+    def collect(self):
+        samples = super(Gauge, self).collect()
+        with self._lock:
+            offsets = list(self._offsets.items())
+        for labels, offset in offsets:
+            samples.setdefault(labels, [0.0])[0] += offset
+        return samples
+
+
+class Histogram(Metric):
+    """ Counts of observations in fixed buckets, and their sum.
+        
+        Each array holds the non-cumulative count of every bucket, the last
+        of which is +Inf, followed by the sum.
+    
+    """
+    type = 'histogram'
+    
+    def __init__(self, name, help='', labels=(), buckets=latency_buckets):
+        buckets = tuple(float(bucket) for bucket in buckets)
+        if len(buckets) == 0 or buckets[-1] != float('inf'):
+            buckets = buckets + (float('inf'), )
+        super(Histogram, self).__init__(name, help, labels, len(buckets) + 1)
+        self.buckets = buckets
+    
+    def observe(self, value, labels=()):
+        values = self._values(labels)
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+    
+    def describe(self):
+        description = super(Histogram, self).describe()
+        description['buckets'] = self.buckets
+        return description
+    
+    def exposition(self, samples):
+        lines = super(Histogram, self).exposition({})
+        names = self.labels + ('le', )
+        for labels, values in sorted(samples.items()):
+            cumulative_count = 0.0
+            for bucket, count in zip(self.buckets, values):
+                cumulative_count += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, format_labels(names, labels + (
+                        '+Inf' if bucket == float('inf') else repr(bucket),
+                    )),
+                    format_number(cumulative_count),
+                ))
+            formatted_labels = format_labels(self.labels, labels)
+            lines.append('{}_sum{} {}'.format(
+                self.name, formatted_labels, format_number(values[-1])
+            ))
+            lines.append('{}_count{} {}'.format(
+                self.name, formatted_labels, format_number(cumulative_count)
+            ))
+        return lines
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """ A set of metrics, exposed together in the Prometheus text format.
+        
+        With a directory, every process forked from the one that created the
+        registry starts counting from zero and writes its metrics to
+        directory/<pid>.json every interval seconds, and aggregate sums the
+        metrics of all of them. Counters and histograms of exited processes
+        are kept; their gauges are not.
+    
+    """
+    def __init__(self, directory=None, interval=5.0):
+        self.directory = directory
+        self.interval = interval
+        self.metrics = {}
+        self._writer = None
+        reference = weakref.ref(self)
+        def after_fork():
+            registry = reference()
+            if registry is not None:
+                registry._after_fork()
+        os.register_at_fork(after_in_child=after_fork)
+    
+    def _register(self, metric):
+        registered = self.metrics.get(metric.name)
+        if registered is None:
+            self.metrics[metric.name] = metric
+            return metric
+        if registered.describe() != metric.describe():
+            raise ValueError(
+                'A different metric is registered as {}.'.format(metric.name)
+            )
+        return registered
+    
+    def counter(self, name, help='', labels=()):
+        return self._register(Counter(name, help, labels))
+    
+    def gauge(self, name, help='', labels=()):
+        return self._register(Gauge(name, help, labels))
+    
+    def histogram(self, name, help='', labels=(), buckets=latency_buckets):
+        return self._register(Histogram(name, help, labels, buckets))
+    
+    def reset(self):
+        for metric in list(self.metrics.values()):
+            metric.reset()
+    
+    def _after_fork(self):
+        self._writer = None
+        if self.directory is None:
+            return
+        self.reset()
+        self._writer = threading.Thread(
+            target=self._write_periodically, name='bocce-metrics', daemon=True,
+        )
+        self._writer.start()
+    
+    def _write_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError:
+                continue
+    
+    def write(self):
+        """ Write this process's metrics to its file in directory, if any. """
+        if self.directory is None:
+            return
+        pid = os.getpid()
+        metrics = {
+            name: [
+                [list(labels), values]
+                for labels, values in metric.collect().items()
+            ]
+            for name, metric in list(self.metrics.items())
+        }
+        filename = os.path.join(self.directory, '{}.json'.format(pid))
+        temporary_filename = '{}.tmp'.format(filename)
+        with open(temporary_filename, 'w') as f:
+            json.dump({'pid': pid, 'metrics': metrics}, f)
+        os.replace(temporary_filename, filename)
+    
+    def _read(self):
+        if self.directory is None:
+            return
+        pid = os.getpid()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json') or name == '{}.json'.format(pid):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+    
+    def aggregate(self):
+        """ Return (metric, samples) for every metric, summed over processes. """
+        aggregated = {
+            name: metric.collect() for name, metric in list(self.metrics.items())
+        }
+        for dump in self._read():
+            alive = _process_exists(dump['pid'])
+            for name, samples in dump['metrics'].items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not alive):
+                    continue
+                totals = aggregated[name]
+                for labels, values in samples:
+                    labels = tuple(labels)
+                    if len(values) != metric.size:
+                        continue
+                    if labels not in totals:
+                        totals[labels] = list(values)
+                        continue
+                    for index, value in enumerate(values):
+                        totals[labels][index] += value
+        return [
+            (self.metrics[name], samples) for name, samples in aggregated.items()
+        ]
+    
+    def exposition(self):
+        lines = []
+        for metric, samples in self.aggregate():
+            lines.extend(metric.exposition(samples))
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """ The metrics an Application records for every request.
+        
+        Requests are labelled with the name of their route or, if it has none,
+        its path; requests matching no route have an empty route label.
+    
+    """
+    def __init__(self, registry=None):
+        if registry is None:
+            registry = Registry()
+        self.registry = registry
+        self.requests = registry.counter(
+            'bocce_requests_total', 'Requests served.',
+            ('route', 'method', 'status'),
+        )
+        self.in_flight = registry.gauge(
+            'bocce_requests_in_flight', 'Requests being served.',
+        )
+        self.duration = registry.histogram(
+            'bocce_request_duration_seconds',
+            'Time from receiving a request to starting its response.',
+            ('route', ), latency_buckets,
+        )
+        self.response_size = registry.histogram(
+            'bocce_response_size_bytes', 'Sizes of response bodies, if known.',
+            ('route', ), size_buckets,
+        )
+        self.compression_ratio = registry.histogram(
+            'bocce_response_compression_ratio',
+            'Compressed over uncompressed sizes of compressed responses.',
+            ('route', ), ratio_buckets,
+        )
+        self._route_labels = {}
+    
+    def route_label(self, route):
+        try:
+            return self._route_labels[route]
+        except KeyError:
+            if route is None:
+                label = ''
+            elif route.name is not None:
+                label = route.name
+            else:
+                label = '/{}'.format(route.path)
+            self._route_labels[route] = label
+            return label
+    
+    def start_request(self):
+        self.in_flight.inc()
+    
+    def finish_request(self):
+        """ Count the request out of those in flight; call it however the
+            request ends.
+        
+        """
+        self.in_flight.dec()
+    
+    def record_response(self, route, request, response, duration):
+        """ Record a request whose response was started duration seconds after
+            it was received.
+        
+        """
+        route_label = (self.route_label(route), )
+        self.requests.inc(labels=(
+            route_label[0], request.http.method, str(response.status_code),
+        ))
+        self.duration.observe(duration, route_label)
+        body = response.body
+        content_length = body.content_length
+        if content_length is None:
+            return
+        content_length = int(content_length)
+        self.response_size.observe(content_length, route_label)
+        uncompressed_length = body.uncompressed_length
+        if body.content_encoding == 'gzip' and uncompressed_length:
+            self.compression_ratio.observe(
+                content_length/float(uncompressed_length), route_label
+            )
+
+
+class Handler:
+    
+    def __init__(self, registry):
+        self.registry = registry
+    
+    def __call__(self, request, response, configuration):
+        response.headers['Cache-Control'] = 'no-store'
+        response.body.set_content(
+            self.registry.exposition().encode('utf-8'), content_type
+        )
@@ -9,25 +9,103 @@ from . import (exceptions, )
 __where__ = os.path.dirname(os.path.abspath(__file__))
 
 
+def bind(middleware, configuration):
+    """ Return the middleware with the configuration bound, or None to skip it.
+        
+        Middleware that reads its settings from the configuration on every
+        request can define a bind(configuration) attribute which reads them
+        once and returns an equivalent callable.
+    
+    """
+    binder = getattr(middleware, 'bind', None)
+    if binder is None:
+        return middleware
+    return binder(configuration)
+
+
+def pipeline(befores, handler, afters, configuration):
+    """ Compile a route's befores, handler and afters into one callable.
+        
+        The callable takes (request, response); the afters are run in reverse
+        order and their exceptions are ignored, as Application does. If a
+        before or the handler returns an exceptions.Handler, the callable
+        returns it at once, for Application to respond with.
+    
+    """
+    befores = tuple(
+        before for before in (bind(b, configuration) for b in befores) 
+        if before is not None
+    )
+    afters = tuple(
+        after for after in (bind(a, configuration) for a in reversed(afters))
+        if after is not None
+    )
+    Handler = exceptions.Handler
+    if len(befores) == 0 and len(afters) == 0:
+        def run(request, response):
+            return handler(request, response, configuration)
+    elif len(afters) == 0:
+        def run(request, response):
+            for before in befores:
+                control = before(request, response, configuration)
+                if control is not None and isinstance(control, Handler):
+                    return control
+            return handler(request, response, configuration)
+    else:
+        def run(request, response):
+            for before in befores:
+                control = before(request, response, configuration)
+                if control is not None and isinstance(control, Handler):
+                    return control
+            control = handler(request, response, configuration)
+            if control is not None and isinstance(control, Handler):
+                return control
+            for after in afters:
+                try:
+                    after(request, response, configuration)
+                except:
+                    continue
+    return run
+
+
 def compress(request, response, configuration):
+    return _bind_compress(configuration)(request, response, configuration)
+
+
+def _bind_compress(configuration):
     defaults = {'level': 2, 'threshold': 128, }
     configuration = configuration.get('bocce', {}).get('compression', defaults)
-    if 'gzip' in request.accept.encodings:
-        try:
-            response.body.compress(
-                configuration['level'],
-                configuration['threshold']
-            )
-        except:
-            pass
+    level = configuration['level']
+    threshold = configuration['threshold']
+    def compress(request, response, configuration):
+        if 'gzip' in request.accept.encodings:
+            try:
+                response.body.compress(level, threshold)
+            except:
+                pass
+    return compress
+
+
+compress.bind = _bind_compress
 
 
 def require_https(request, response, configuration):
+    bound = _bind_require_https(configuration)
+    if bound is None:
+        return
+    return bound(request, response, configuration)
+
+
+def _bind_require_https(configuration):
     secure = configuration.get('bocce', {}).get('secure', True)
     if secure == False:
-        return
-    if request.url.scheme != 'https':
-        response = exceptions.PermanentRedirectHandler(scheme='https', port=None)
-        raise response
-    # require https for all future requests on this domain
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000'
+        return None
+    def require_https(request, response, configuration):
+        if request.url.scheme != 'https':
+            return exceptions.PermanentRedirectHandler(scheme='https', port=None)
+        # require https for all future requests on this domain
+        response.headers['Strict-Transport-Security'] = 'max-age=31536000'
+    return require_https
+
+
+require_https.bind = _bind_require_https
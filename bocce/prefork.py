@@ -0,0 +1,363 @@
+# standard libraries
+import os
+import logging
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+# third party libraries
+pass
+# first party libraries
+pass
+
+
+__where__ = os.path.dirname(os.path.abspath(__file__))
+
+
+# in a worker, the pipe on which it tells the supervisor it is serving
+_ready_fd = None
+
+
+def listen(host='127.0.0.1', port=8080, reuse_port=False, backlog=1024):
+    if ':' in host:
+        family = socket.AF_INET6
+    else:
+        family = socket.AF_INET
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise ValueError('SO_REUSEPORT is not supported on this platform.')
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    return listener
+
+
+def inherited_listeners():
+    """ Return the listeners handed over by a re-executed supervisor, or None. """
+    fds = os.environ.pop('BOCCE_LISTENER_FDS', None)
+    if fds is None:
+        return None
+    return [socket.socket(fileno=int(fd)) for fd in fds.split(',') if fd]
+
+
+def notify_ready():
+    """ Tell the supervisor, if any, that this worker is serving requests. """
+    global _ready_fd
+    if _ready_fd is None:
+        return
+    try:
+        os.write(_ready_fd, b'.')
+    except OSError:
+        pass
+    os.close(_ready_fd)
+    _ready_fd = None
+
+
+class _Worker:
+    
+    __slots__ = ('pid', 'index', 'generation', 'ready_fd', 'ready', 'started',
+                 'stop_deadline', )
+    
+    def __init__(self, pid, index, generation, ready_fd):
+        self.pid = pid
+        self.index = index
+        self.generation = generation
+        self.ready_fd = ready_fd
+        self.ready = False
+        self.started = time.monotonic()
+        self.stop_deadline = None
+
+
+class Supervisor:
+    """ Fork workers and replace any that exit until the supervisor is stopped.
+        
+        target(index) is run in each worker, which then exits; the supervisor
+        writes its own PID to pid_filename and each worker's to
+        pid_filename.index. Signals:
+        
+        - SIGTERM or SIGINT stops the workers and returns from run once they
+          have drained, or graceful_timeout has passed.
+        - SIGHUP starts a new generation of workers and, once all of them
+          have called notify_ready, stops the previous generation gracefully.
+          If they are not ready within ready_timeout, they are stopped instead.
+          A SIGHUP received while workers are starting is handled once they
+          are ready.
+        - SIGUSR2 re-executes the supervisor's command line, new code and all,
+          handing it the listeners; once the new supervisor's workers are
+          ready, it stops this supervisor as SIGTERM would.
+    
+    """
+    def __init__(self, target, workers, pid_filename='PID', restart_delay=1.0,
+                 graceful_timeout=30.0, ready_timeout=60.0, listeners=(),
+                 logger=None):
+        self.target = target
+        self.number_workers = workers
+        self.pid_filename = pid_filename
+        self.restart_delay = restart_delay
+        self.graceful_timeout = graceful_timeout
+        self.ready_timeout = ready_timeout
+        self.listeners = listeners
+        if logger is None:
+            logger = logging.getLogger('bocce')
+        self.logger = logger
+        # maps the PID of every running worker to its _Worker
+        self.workers = {}
+        # the last generation started, which only increases, and the last one
+        # ready, which serves and whose workers are replaced if they exit
+        self.generation = 0
+        self.active_generation = 0
+        self.ready_deadline = None
+        self.reload_pending = False
+        self.stopping = False
+        self.parent_pid = None
+        self.reexec_pid = None
+        self._signals = []
+    
+    def worker_pid_filename(self, index):
+        return '{}.{}'.format(self.pid_filename, index)
+    
+    def spawn(self, index, generation=None):
+        if generation is None:
+            generation = self.generation
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            global _ready_fd
+            status = 0
+            try:
+                os.close(read_fd)
+                for worker in self.workers.values():
+                    if worker.ready_fd is not None:
+                        os.close(worker.ready_fd)
+                _ready_fd = write_fd
+                for signal_number in self._handled_signals:
+                    signal.signal(signal_number, signal.SIG_DFL)
+                write_pid(self.worker_pid_filename(index), os.getpid())
+                self.target(index)
+            except:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        os.close(write_fd)
+        self.workers[pid] = _Worker(pid, index, generation, read_fd)
+        return pid
+    
+    _handled_signals = (
+        signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR2,
+    )
+    
+    def _signal(self, signal_number, frame=None):
+        # handled in the main loop, outside the handler
+        self._signals.append(signal_number)
+    
+    def stop(self):
+        self.stopping = True
+        for worker in list(self.workers.values()):
+            self._stop_worker(worker)
+    
+    def _stop_worker(self, worker):
+        if worker.stop_deadline is not None:
+            return
+        worker.stop_deadline = time.monotonic() + self.graceful_timeout
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    
+    def reload(self):
+        if self.stopping:
+            return
+        if self.ready_deadline is not None:
+            # reload once the workers being started are ready
+            self.reload_pending = True
+            return
+        self.logger.info('Reloading {} workers.'.format(self.number_workers))
+        self._start_generation()
+    
+    def reexec(self):
+        if self.stopping or self.reexec_pid is not None:
+            return
+        for listener in self.listeners:
+            listener.set_inheritable(True)
+        environment = dict(
+            os.environ,
+            BOCCE_LISTENER_FDS=','.join(
+                str(listener.fileno()) for listener in self.listeners
+            ),
+            BOCCE_PARENT_PID=str(os.getpid()),
+        )
+        arguments = getattr(sys, 'orig_argv', [sys.executable] + sys.argv)
+        self.logger.info('Re-executing {}.'.format(' '.join(arguments)))
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.execve(sys.executable, arguments, environment)
+            finally:
+                os._exit(1)
+        self.reexec_pid = pid
+    
+    def _start_generation(self):
+        self.generation += 1
+        self.ready_deadline = time.monotonic() + self.ready_timeout
+        for index in range(self.number_workers):
+            self.spawn(index)
+    
+    def run(self):
+        write_pid(self.pid_filename, os.getpid())
+        self.parent_pid = os.environ.pop('BOCCE_PARENT_PID', None)
+        previous_handlers = {
+            signal_number: signal.signal(signal_number, self._signal)
+            for signal_number in self._handled_signals
+        }
+        try:
+            self._start_generation()
+            while len(self.workers) > 0 or not self.stopping:
+                self._wait_for_readiness(0.1)
+                self._reap()
+                self._handle_signals()
+                self._check_generations()
+                self._check_deadlines()
+        finally:
+            for signal_number, handler in previous_handlers.items():
+                signal.signal(signal_number, handler)
+            remove_pid(self.pid_filename, os.getpid())
+    
+    def _wait_for_readiness(self, timeout):
+        fds = {
+            worker.ready_fd: worker for worker in self.workers.values()
+            if worker.ready_fd is not None
+        }
+        if len(fds) == 0:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select(list(fds), [], [], timeout)
+        for fd in readable:
+            worker = fds[fd]
+            # a worker that exits before it is ready closes the pipe unread
+            worker.ready = os.read(fd, 1) == b'.'
+            os.close(fd)
+            worker.ready_fd = None
+    
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid == self.reexec_pid:
+                self.logger.error(
+                    'The re-executed supervisor (PID {}) exited with status '
+                    '{}.'.format(pid, status)
+                )
+                self.reexec_pid = None
+                continue
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            if worker.ready_fd is not None:
+                os.close(worker.ready_fd)
+            remove_pid(self.worker_pid_filename(worker.index), pid)
+            if self.stopping or worker.stop_deadline is not None:
+                continue
+            # the generation starting, or the active one if none is; the
+            # previous one is left to be stopped once the new one is ready
+            if worker.generation != self.generation and (
+                worker.generation != self.active_generation or 
+                self.ready_deadline is not None
+            ):
+                continue
+            self.logger.warning(
+                'Worker {} (PID {}) exited with status {}; restarting.'.format(
+                    worker.index, pid, status
+                )
+            )
+            # do not spin if a worker cannot start at all
+            if time.monotonic() - worker.started < self.restart_delay:
+                time.sleep(self.restart_delay)
+            self.spawn(worker.index, worker.generation)
+    
+    def _handle_signals(self):
+        while len(self._signals) > 0:
+            signal_number = self._signals.pop(0)
+            if signal_number in (signal.SIGTERM, signal.SIGINT):
+                self.stop()
+            elif signal_number == signal.SIGHUP:
+                self.reload()
+            elif signal_number == signal.SIGUSR2:
+                self.reexec()
+    
+    def _check_generations(self):
+        if self.ready_deadline is None or self.stopping:
+            return
+        current = [
+            worker for worker in self.workers.values()
+            if worker.generation == self.generation
+        ]
+        if len(current) == self.number_workers and all(
+            worker.ready for worker in current
+        ):
+            # the new generation serves; the previous ones drain and exit
+            self.ready_deadline = None
+            self.active_generation = self.generation
+            for worker in list(self.workers.values()):
+                if worker.generation != self.generation:
+                    self._stop_worker(worker)
+            if self.parent_pid is not None:
+                os.kill(int(self.parent_pid), signal.SIGTERM)
+                self.parent_pid = None
+        elif time.monotonic() > self.ready_deadline:
+            self.ready_deadline = None
+            if any(
+                worker.generation == self.active_generation and 
+                worker.stop_deadline is None
+                for worker in self.workers.values()
+            ):
+                self.logger.error(
+                    'Generation {} of workers was not ready within {} seconds; '
+                    'keeping the previous one.'.format(
+                        self.generation, self.ready_timeout
+                    )
+                )
+                for worker in current:
+                    self._stop_worker(worker)
+            else:
+                # nothing older to keep
+                self.active_generation = self.generation
+        else:
+            return
+        if self.reload_pending:
+            self.reload_pending = False
+            self.reload()
+    
+    def _check_deadlines(self):
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.stop_deadline is not None and now > worker.stop_deadline:
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+
+def write_pid(filename, pid):
+    with open(filename, 'wb') as f:
+        f.write(str(pid).encode('ascii'))
+
+
+def remove_pid(filename, pid=None):
+    """ Remove a PID file, unless it has since been taken by another pid. """
+    try:
+        if pid is not None:
+            with open(filename, 'rb') as f:
+                if f.read().decode('ascii').strip() != str(pid):
+                    return
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
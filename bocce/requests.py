@@ -5,6 +5,7 @@ import collections
 import copy
 import json
 import codecs
+import time
 # third party libraries
 import werkzeug
 # first party libraries
@@ -115,6 +116,13 @@ class Body:
 
 class Request:
     
+    # the time.perf_counter by which the request should be answered, if any;
+    # set by Application from the route's timeout and the request's headers
+    deadline = None
+    # callables Application runs with (request, response) once the response
+    # is final, whatever happened; see add_finalizer
+    finalizers = ()
+    
     def __init__(self, request):
         self._request = request
         self.http = Http(
@@ -160,6 +168,25 @@ class Request:
         with werkzeug.Request(environment, populate_request=False) as request:
             return cls(request)
     
+    def remaining(self):
+        """ Return the seconds left until the deadline, or None if none is set.
+            
+            Pass it as the timeout of calls to other services.
+        
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.perf_counter())
+    
+    def add_finalizer(self, finalizer):
+        """ Call finalizer(request, response) after the afters, even if the
+            request was answered by an exceptions.Handler or failed.
+        
+        """
+        if len(self.finalizers) == 0:
+            self.finalizers = []
+        self.finalizers.append(finalizer)
+    
     def __str__(self):
         raise NotImplementedError
     
@@ -100,10 +100,13 @@ class BodyFile(BodyIterable):
 
 class BodyContent:
     
-    def __init__(self, content, content_type):
+    def __init__(self, content, content_type, content_encoding=None):
         self._content = content
         self.content_type = content_type
-        self.content_encoding = None
+        # content given encoded is sent as it is
+        self.content_encoding = content_encoding
+        self._compressed_content = content
+        self.uncompressed_length = None
     
     @property
     def content(self):
@@ -117,8 +120,9 @@ class BodyContent:
         return len(self.content)
     
     def compress(self, level=2, threshold=128):
-        if len(self._content) < threshold:
+        if len(self._content) < threshold or self.content_encoding is not None:
             return
+        self.uncompressed_length = len(self._content)
         compressed_content = io.BytesIO()
         with gzip.GzipFile(fileobj=compressed_content, mode='wb', compresslevel=level) as f:
             f.write(self._content)
@@ -148,6 +152,7 @@ class JsonBody(collections.OrderedDict):
         self.charset = charset
         self.content_type = 'application/json; charset={}'.format(charset)
         self.content_encoding = None
+        self.uncompressed_length = None
         self._cached_content = None
         self._compression_level = None
         self._compression_threshold = None
@@ -176,6 +181,7 @@ class JsonBody(collections.OrderedDict):
         compression_level = getattr(self, '_compression_level', 2)
         compression_requested = getattr(self, '_compression_requested', False)
         if compression_requested and len(content) >= compression_threshold:
+            self.uncompressed_length = len(content)
             compressed_content = io.BytesIO()
             with gzip.GzipFile(fileobj=compressed_content, mode='wb', compresslevel=compression_level) as f:
                 f.write(content)
@@ -221,6 +227,11 @@ class Body:
             content_encoding = str(content_encoding)
         return content_encoding
     
+    @property
+    def uncompressed_length(self):
+        # the length of a compressed body before compression, if known
+        return getattr(self._iterable, 'uncompressed_length', None)
+    
     def compress(self, *args):
         self._iterable.compress(*args)
     
@@ -260,8 +271,8 @@ class Body:
                 content_type = '{}; {}'.format(mimetype, charset)
         self.set_content(text.encode(charset), content_type)
     
-    def set_content(self, content, content_type=None):
-        self._iterable = BodyContent(content, content_type)
+    def set_content(self, content, content_type=None, content_encoding=None):
+        self._iterable = BodyContent(content, content_type, content_encoding)
     
     def set_iterable(self, iterable, content_length=None, content_type=None,
                      content_encoding=None):
@@ -5,30 +5,94 @@ import collections
 import collections.abc
 import inspect
 import posixpath
+import urllib.parse
 import copy
+import hashlib
+import pickle
+import datetime
+import uuid
 # third party libraries
 pass
 # first party libraries
-from . import (utils, )
+from . import (utils, surly, )
 
 
 __where__ = os.path.dirname(os.path.abspath(__file__))
 
 
+class Converter:
+    """ Converts a typed path segment, e.g. {id:int}, to and from a URL.
+        
+        The regex is embedded in the route regex and is used to validate a 
+        segment before to_python, which may also raise ValueError to reject it.
+        A converter whose regex may match a / must set spans_segments; its
+        placeholders are then matched, and quoted, as pointy ones are.
+    
+    """
+    def __init__(self, regex, to_python=str, to_url=str, spans_segments=False):
+        self.regex = regex
+        self.to_python = to_python
+        self.to_url = to_url
+        self.spans_segments = spans_segments
+        self._pattern = re.compile('\\A(?:{})\\Z'.format(regex))
+    
+    def convert(self, segment):
+        if self._pattern.match(segment) is None:
+            raise ValueError(
+                'Segment {} does not match {}.'.format(segment, self.regex)
+            )
+        return self.to_python(segment)
+
+
+def _to_date(segment):
+    return datetime.datetime.strptime(segment, '%Y-%m-%d').date()
+
+
+converters = {
+    'str': Converter('[^/]+'),
+    'path': Converter('.+', spans_segments=True),
+    'int': Converter('-?[0-9]+', int),
+    'float': Converter('-?[0-9]+(?:\\.[0-9]+)?', float),
+    'uuid': Converter(
+        '[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+        '[0-9a-fA-F]{12}',
+        uuid.UUID,
+    ),
+    'date': Converter('[0-9]{4}-[0-9]{2}-[0-9]{2}', _to_date, 
+                      datetime.date.isoformat),
+}
+
+
 class Route:
     
     _dsl_to_regex_pattern = re.compile(
         '{(?P<curly_segment>[^/]+?)}|<(?P<pointy_segment>[^/]+?)>'
     )
+    _unreserved_pattern = re.compile('[A-Za-z0-9_.~-]*\\Z')
+    
+    _middleware_kinds = ('configure', 'before', 'after', )
     
     def __init__(self, path, handler, methods=('GET', None, ),
-                 subdomains=('www', None, )):
+                 subdomains=('www', None, ), name=None, share_handler=False):
         self._arg_path = path
         self._path = path.lstrip(' /').rstrip()
-        self.handler = copy.deepcopy(handler)
-        self.handler.configure = getattr(self.handler, 'configure', [])
-        self.handler.before = getattr(self.handler, 'before', [])
-        self.handler.after = getattr(self.handler, 'after', [])
+        self.name = name
+        # a shared handler is never cloned or modified; its middleware lists 
+        # are only copied into the route once the route adds to them
+        self.share_handler = share_handler
+        if share_handler:
+            self.handler = handler
+        else:
+            self.handler = copy.deepcopy(handler)
+            for kind in self._middleware_kinds:
+                setattr(self.handler, kind, getattr(self.handler, kind, []))
+        self._middleware = {
+            kind: getattr(self.handler, kind, ()) 
+            for kind in self._middleware_kinds
+        }
+        self._owned_middleware = set()
+        # the compiled middleware chain; built by Application.configure
+        self.pipeline = None
         if isinstance(methods, str):
             raise TypeError(
                 'The variable methods must be an iterable of string-likes.'
@@ -39,25 +103,94 @@ class Route:
                 'The variable subdomains must be an iterable of string-likes.'
             )
         self.subdomains = set(subdomains)
-        # counting matches
-        self._number_curly_segments = 0
-        self._number_pointy_segments = 0
         self._number_verbatim_segments = None
-        # construct route regex
-        self._regex = re.compile(
-            re.sub(
-                self._dsl_to_regex_pattern,
-                self._sub_regex_for_dsl, 
-                '\A{}\Z'.format(self.path)
-            )
-        )
+        # the regex, converters, url template and trie segments are compiled
+        # on first use (see __getattr__) or loaded from a snapshot; only the 
+        # placeholders are checked up front, so that the regex compiles
+        names = set()
+        for match in self._dsl_to_regex_pattern.finditer(self.path):
+            name, _, _ = self._parse_placeholder(match)
+            if not name.isidentifier():
+                raise ValueError(
+                    'Invalid segment name {} in route {}.'.format(
+                        name, self._arg_path
+                    )
+                )
+            if name in names:
+                raise ValueError(
+                    'Duplicate segment name {} in route {}.'.format(
+                        name, self._arg_path
+                    )
+                )
+            names.add(name)
+    
+    _compiled_attributes = frozenset((
+        '_regex_source', '_converters', '_template', '_segments', '_has_tail',
+        '_number_curly_segments', '_number_pointy_segments', 
+    ))
+    
+    def __getattr__(self, name):
+        # only called for attributes that have not been set yet
+        if name in self._compiled_attributes:
+            self._compile()
+        elif name == '_regex':
+            self._regex = re.compile(self._regex_source)
+        else:
+            raise AttributeError(name)
+        return self.__dict__[name]
+    
+    @property
+    def _compiled_state(self):
+        return {name: getattr(self, name) for name in self._compiled_attributes}
     
     @property
     def path(self):
         return self._path
     
-    def copy(self):
-        return copy.deepcopy(self)
+    def copy(self, path=None):
+        if path is None:
+            path = self._arg_path
+        route = self.__class__(
+            path, self.handler, self.methods, self.subdomains, self.name, 
+            self.share_handler,
+        )
+        # the route's own middleware, not its handler's, which may be shared
+        route._middleware = {
+            kind: list(middleware) 
+            for kind, middleware in self._middleware.items()
+        }
+        route._owned_middleware = set(self._middleware_kinds)
+        return route
+    
+    @property
+    def configure(self):
+        return self._middleware['configure']
+    
+    @property
+    def before(self):
+        return self._middleware['before']
+    
+    @property
+    def after(self):
+        return self._middleware['after']
+    
+    def _own_middleware(self, kind):
+        middleware = self._middleware[kind]
+        if kind not in self._owned_middleware:
+            middleware = self._middleware[kind] = list(middleware)
+            self._owned_middleware.add(kind)
+        # the compiled pipeline no longer matches the middleware
+        self.pipeline = None
+        return middleware
+    
+    def add_to_configure(self, middleware, index=-1):
+        self._own_middleware('configure').insert(index, middleware)
+    
+    def add_to_before(self, middleware, index=-1):
+        self._own_middleware('before').insert(index, middleware)
+    
+    def add_to_after(self, middleware, index=0):
+        self._own_middleware('after').insert(index, middleware)
     
     @property
     def number_curly_segments(self):
@@ -78,26 +211,152 @@ class Route:
     def match(self, path, method=None, subdomain=None):
         if method not in self.methods:
             return None
-        #if subdomain not in self.subdomains:
-        #    return None
+        if subdomain not in self.subdomains:
+            return None
         match = self._regex.match(path.lstrip(' /').rstrip())
         if match is None:
             return None
-        segments = match.groupdict()
+        return self._convert(match.groupdict(), self._converters)
+    
+    @staticmethod
+    def _convert(segments, converters):
+        # returns None if any typed segment cannot be converted
+        for name, converter in converters.items():
+            try:
+                segments[name] = converter.to_python(segments[name])
+            except ValueError:
+                return None
         return segments
     
-    def _sub_regex_for_dsl(self, match):
-        match = match.groupdict()
-        curly_segment = match['curly_segment']
-        pointy_segment = match['pointy_segment']
+    def _parse_placeholder(self, match):
+        curly_segment = match.group('curly_segment')
+        pointy_segment = match.group('pointy_segment')
         if curly_segment is not None:
-            self._number_curly_segments += 1
-            return '(?P<{}>[^/]+)'.format(curly_segment)
+            name, _, converter_name = curly_segment.partition(':')
+            regex = '[^/]+'
         elif pointy_segment is not None:
-            self._number_pointy_segments += 1
-            return '(?P<{}>.+)'.format(pointy_segment)
+            name, _, converter_name = pointy_segment.partition(':')
+            regex = '.+'
         else:
             raise ValueError # should never happen
+        if converter_name == '':
+            return name, None, regex
+        try:
+            converter = converters[converter_name]
+        except KeyError:
+            raise ValueError(
+                'Unknown converter {} in route {}.'.format(
+                    converter_name, self._arg_path
+                )
+            )
+        return name, converter, converter.regex
+    
+    def _spans_segments(self, match):
+        # pointy placeholders, and curly ones whose converter may match a /
+        if match.group('pointy_segment') is not None:
+            return True
+        converter = self._parse_placeholder(match)[1]
+        return converter is not None and converter.spans_segments
+    
+    def _translate(self, text, placeholders):
+        # verbatim text is escaped so that it is matched literally
+        regex = []
+        position = 0
+        for match in self._dsl_to_regex_pattern.finditer(text):
+            name, converter, placeholder_regex = self._parse_placeholder(match)
+            regex.append(re.escape(text[position:match.start()]))
+            regex.append('(?P<{}>{})'.format(name, placeholder_regex))
+            placeholders.append((name, converter, match))
+            position = match.end()
+        regex.append(re.escape(text[position:]))
+        return ''.join(regex)
+    
+    def _compile(self):
+        placeholders = []
+        self._regex_source = '\\A{}\\Z'.format(
+            self._translate(self.path, placeholders)
+        )
+        self._number_curly_segments = 0
+        self._number_pointy_segments = 0
+        self._converters = {}
+        # the url template alternates verbatim text with (name, to_url, safe)
+        template = []
+        position = 0
+        for name, converter, match in placeholders:
+            if match.group('curly_segment') is not None:
+                self._number_curly_segments += 1
+            else:
+                self._number_pointy_segments += 1
+            safe = '/' if self._spans_segments(match) else ''
+            if converter is not None:
+                self._converters[name] = converter
+                to_url = converter.to_url
+            else:
+                to_url = str
+            if match.start() > position:
+                template.append(self.path[position:match.start()])
+            template.append((name, to_url, safe))
+            position = match.end()
+        if position < len(self.path):
+            template.append(self.path[position:])
+        self._template = tuple(template)
+        # split route into per-segment specifications for the segment trie
+        self._segments, self._has_tail = self._split_segments(self.path)
+    
+    def url(self, **segments):
+        parts = []
+        for part in self._template:
+            if part.__class__ is str:
+                parts.append(part)
+                continue
+            name, to_url, safe = part
+            try:
+                value = segments.pop(name)
+            except KeyError:
+                raise KeyError(
+                    'Route {} requires segment {}.'.format(self._arg_path, name)
+                )
+            value = to_url(value)
+            if self._unreserved_pattern.match(value) is None:
+                value = urllib.parse.quote(value, safe=safe)
+            parts.append(value)
+        # any remaining segments are passed along as the query string
+        if segments:
+            query_string = surly.QueryString(segments.items(), quote=True)
+        else:
+            query_string = None
+        return surly.construct_url(
+            path=''.join(parts), query_string=query_string
+        )
+    
+    def _split_segments(self, path):
+        # each segment is one of ('verbatim', text), ('curly', (name, 
+        # converter)) or ('pattern', (regex, converters)); everything from the
+        # first pointy segment, or curly one whose converter spans segments,
+        # on is matched against the route regex as a whole
+        segments = []
+        for segment in path.split('/'):
+            matches = list(self._dsl_to_regex_pattern.finditer(segment))
+            if len(matches) == 0:
+                segments.append(('verbatim', segment))
+            elif any(self._spans_segments(match) for match in matches):
+                break
+            elif len(matches) == 1 and matches[0].group(0) == segment:
+                name, converter, _ = self._parse_placeholder(matches[0])
+                segments.append(('curly', (name, converter)))
+            else:
+                placeholders = []
+                regex = re.compile(
+                    '\\A{}\\Z'.format(self._translate(segment, placeholders))
+                )
+                converters = {
+                    name: converter for name, converter, _ in placeholders 
+                    if converter is not None
+                }
+                segments.append(('pattern', (regex, converters)))
+        else:
+            return tuple(segments), False
+        return tuple(segments), True
     
     def __str__(self):
         return '{} => {}'.format(
@@ -117,11 +376,273 @@ class Route:
         )
 
 
+# bumped whenever the compiled state of routes changes
+_snapshot_version = 2
+
+
+class _Node:
+    
+    __slots__ = ('verbatim', 'curly', 'patterns', 'tails', 'terminals', )
+    
+    def __init__(self):
+        self.verbatim = {}
+        self.curly = {}
+        self.patterns = []
+        self.tails = []
+        self.terminals = []
+
+
+class SegmentTrie:
+    """ A compiled matcher that walks a path one segment at a time.
+    
+        Verbatim segments are resolved with a single dictionary lookup, so the
+        cost of a match depends upon the depth of the path and the number of
+        placeholders competing at each level rather than the number of routes.
+        Routes are referenced by their index in the originating table and the
+        best candidate is chosen with the same priority as a linear scan: 
+        verbatim segments first, then curly segments, then declaration order.
+        
+        Only the routes at the given indices are inserted, which allows a 
+        table to be partitioned into several tries that share priorities.
+    
+    """
+    def __init__(self, routes, indices=None):
+        self.routes = tuple(routes)
+        self.root = _Node()
+        self.priorities = {}
+        if indices is None:
+            indices = range(len(self.routes))
+        for index in indices:
+            route = self.routes[index]
+            self.priorities[index] = (
+                route.number_verbatim_segments,
+                route.number_curly_segments,
+                -index,
+            )
+            self._insert(index, route)
+    
+    def __getstate__(self):
+        # routes hold handlers, so they are reattached by the owner on load
+        return {'root': self.root, 'priorities': self.priorities}
+    
+    def __setstate__(self, state):
+        self.routes = None
+        self.root = state['root']
+        self.priorities = state['priorities']
+    
+    def _insert(self, index, route):
+        node = self.root
+        for kind, value in route._segments:
+            if kind == 'verbatim':
+                children = node.verbatim
+            elif kind == 'curly':
+                children = node.curly
+            if kind in ('verbatim', 'curly'):
+                child = children.get(value)
+                if child is None:
+                    child = children[value] = _Node()
+                node = child
+            else:
+                for pattern, child in node.patterns:
+                    if pattern == value:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.patterns.append((value, child))
+                    node = child
+        if route._has_tail:
+            node.tails.append(index)
+        else:
+            node.terminals.append(index)
+    
+    def match(self, path):
+        path = path.lstrip(' /').rstrip()
+        candidates = []
+        self._walk(self.root, path, path.split('/'), 0, [], candidates)
+        if len(candidates) == 0:
+            return None
+        _, index, segments = max(candidates)
+        if not isinstance(segments, dict):
+            segments = dict(segments)
+        return self.routes[index], segments
+    
+    def _walk(self, node, path, parts, depth, captures, candidates):
+        routes = self.routes
+        priorities = self.priorities
+        for index in node.tails:
+            route = routes[index]
+            match = route._regex.match(path)
+            if match is None:
+                continue
+            segments = route._convert(match.groupdict(), route._converters)
+            if segments is not None:
+                candidates.append((priorities[index], index, segments))
+        if depth == len(parts):
+            for index in node.terminals:
+                candidates.append((priorities[index], index, tuple(captures)))
+            return
+        part = parts[depth]
+        child = node.verbatim.get(part)
+        if child is not None:
+            self._walk(child, path, parts, depth + 1, captures, candidates)
+        if part == '':
+            return
+        for (name, converter), child in node.curly.items():
+            if converter is None:
+                value = part
+            else:
+                # a segment of the wrong type falls through to other routes
+                try:
+                    value = converter.convert(part)
+                except ValueError:
+                    continue
+            captures.append((name, value))
+            self._walk(child, path, parts, depth + 1, captures, candidates)
+            captures.pop()
+        for (pattern, converters), child in node.patterns:
+            match = pattern.match(part)
+            if match is None:
+                continue
+            segments = Route._convert(match.groupdict(), converters)
+            if segments is None:
+                continue
+            number_captures = len(captures)
+            captures.extend(segments.items())
+            self._walk(child, path, parts, depth + 1, captures, candidates)
+            del captures[number_captures:]
+
+
 class Routes(collections.UserList):
     
-    def __init__(self, cache_size=1e5):
+    def __init__(self, cache_size=1e5, negative_cache_size=1e4, 
+                 cache_admission=True, share_handlers=False):
         super(Routes, self).__init__()
-        self.cache = utils.LRUCache(cache_size)
+        self.share_handlers = share_handlers
+        # with admission, paths seen once (e.g. one per user) are not cached 
+        # at the expense of frequently requested ones
+        self.cache = utils.ClockCache(cache_size, admission=cache_admission)
+        # unmatched keys are kept apart so junk paths cannot evict real matches
+        self.negative_cache = utils.ClockCache(negative_cache_size)
+        self._matchers = None
+        self._names = None
+        self._frozen = False
+        # a statistics.Statistics instance, if matches should be counted
+        self.statistics = None
+    
+    def _invalidate(self):
+        # the caches are only filled once matchers exist
+        if self._matchers is not None:
+            self.cache.flush()
+            self.negative_cache.flush()
+        self._matchers = None
+        self._names = None
+    
+    def _partition(self):
+        # one trie per (method, subdomain) pair accepted by at least one route;
+        # pairs that accept exactly the same routes share a trie
+        routes = tuple(self)
+        buckets = collections.defaultdict(list)
+        for index, route in enumerate(routes):
+            for method in route.methods:
+                for subdomain in route.subdomains:
+                    buckets[(method, subdomain)].append(index)
+        tries = {}
+        for indices in buckets.values():
+            indices = tuple(indices)
+            if indices not in tries:
+                tries[indices] = SegmentTrie(routes, indices)
+        return {key: tries[tuple(indices)] for key, indices in buckets.items()}
+    
+    def _invalidating(method):
+        def wrapper(self, *args, **kwargs):
+            if self._frozen:
+                raise RuntimeError(
+                    'Routes are frozen; call thaw before modifying them.'
+                )
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._invalidate()
+        wrapper.__name__ = method.__name__
+        return wrapper
+    
+    __setitem__ = _invalidating(collections.UserList.__setitem__)
+    __delitem__ = _invalidating(collections.UserList.__delitem__)
+    __iadd__ = _invalidating(collections.UserList.__iadd__)
+    __imul__ = _invalidating(collections.UserList.__imul__)
+    append = _invalidating(collections.UserList.append)
+    insert = _invalidating(collections.UserList.insert)
+    pop = _invalidating(collections.UserList.pop)
+    remove = _invalidating(collections.UserList.remove)
+    clear = _invalidating(collections.UserList.clear)
+    reverse = _invalidating(collections.UserList.reverse)
+    sort = _invalidating(collections.UserList.sort)
+    extend = _invalidating(collections.UserList.extend)
+    del _invalidating
+    
+    @property
+    def frozen(self):
+        return self._frozen
+    
+    def freeze(self, snapshot=None):
+        """ Compile the table into its matchers and disallow further changes.
+            
+            If a snapshot filename is given, the compiled routes and tries are
+            loaded from it when it was written for an identical table (as 
+            identified by a hash of the route definitions), and written to it
+            otherwise, so restarted and pre-forked workers skip compilation.
+            The snapshot is unpickled, so it must not be writable by others.
+        
+        """
+        routes = tuple(self)
+        key = self._snapshot_key(routes)
+        loaded = snapshot is not None and self._load_snapshot(snapshot, key, routes)
+        if loaded == False:
+            self._matchers = self._partition()
+            if snapshot is not None:
+                self._dump_snapshot(snapshot, key, routes)
+        self._frozen = True
+    
+    def thaw(self):
+        self._frozen = False
+    
+    @staticmethod
+    def _snapshot_key(routes):
+        definitions = [_snapshot_version]
+        for route in routes:
+            definitions.append((
+                route.path,
+                sorted(route.methods, key=repr),
+                sorted(route.subdomains, key=repr),
+            ))
+        for name, converter in sorted(converters.items()):
+            definitions.append((name, converter.regex))
+        return hashlib.sha1(repr(definitions).encode('utf-8')).hexdigest()
+    
+    def _load_snapshot(self, snapshot, key, routes):
+        try:
+            with open(snapshot, 'rb') as f:
+                snapshot_key, states, matchers = pickle.load(f)
+        except Exception:
+            return False
+        if snapshot_key != key or len(states) != len(routes):
+            return False
+        for route, state in zip(routes, states):
+            route.__dict__.update(state)
+        for matcher in matchers.values():
+            matcher.routes = routes
+        self._matchers = matchers
+        return True
+    
+    def _dump_snapshot(self, snapshot, key, routes):
+        states = [route._compiled_state for route in routes]
+        temporary_snapshot = '{}.{}'.format(snapshot, os.getpid())
+        with open(temporary_snapshot, 'wb') as f:
+            pickle.dump(
+                (key, states, self._matchers), f, pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(temporary_snapshot, snapshot)
     
     def add_routes(self, path, routes):
         base = path
@@ -132,55 +653,70 @@ class Routes(collections.UserList):
                 path = base
             else:
                 path = posixpath.join(base, route.path)
-            self.append(
-                Route(
-                    path,
-                    route.handler,
-                    route.methods,
-                    route.subdomains,
-                )
-            )
+            self.append(route.copy(path))
     
     def add_handler(self, path, handler, methods=('GET', None, ), 
-                    subdomains=('www', None, )):
-        route = Route(path, handler, methods, subdomains)
+                    subdomains=('www', None, ), name=None, share_handler=None):
+        if share_handler is None:
+            share_handler = self.share_handlers
+        route = Route(path, handler, methods, subdomains, name, share_handler)
         self.append(route)
         return route
     
+    def url_for(self, route_or_name, **segments):
+        """ Build the path of a route, by Route or by name, from its segments.
+            
+            Segments that are not part of the route become the query string.  
+            For an absolute URL, pass the result as the path to Url.replace.
+        
+        """
+        if isinstance(route_or_name, Route):
+            return route_or_name.url(**segments)
+        names = self._names
+        if names is None:
+            names = {}
+            for route in self:
+                if route.name is not None:
+                    names.setdefault(route.name, route)
+            self._names = names
+        return names[route_or_name].url(**segments)
+    
     def add_to_configure(self, middleware, index=-1):
         for route in self:
-            route.handler.configure.insert(index, middleware)
+            route.add_to_configure(middleware, index)
     
     def add_to_before(self, middleware, index=-1):
         for route in self:
-            route.handler.before.insert(index, middleware)
+            route.add_to_before(middleware, index)
     
     def add_to_after(self, middleware, index=0):
         for route in self:
-            route.handler.after.insert(index, middleware)
+            route.add_to_after(middleware, index)
     
     def match(self, path, method=None, subdomain=None):
         key = (path, method, subdomain)
-        if key in self.cache:
-            return self.cache[key]
-        matches = []
-        for index, route in enumerate(self):
-            segments = route.match(path, method, subdomain)
-            if segments is None:
-                continue
-            priority = -index
-            match = (
-                route.number_verbatim_segments,
-                route.number_curly_segments,
-                priority,
-                route,
-                segments,
-            )
-            matches.append(match)
-        if len(matches) > 0:
-            best_match = max(matches)
-            _, _, _, route, segments = best_match
-            self.cache[key] = route, segments
-            return route, segments
-        else:
+        statistics = self.statistics
+        # checked first, so repeated junk paths do not count towards the
+        # positive cache's admission (see utils.ClockCache)
+        if key in self.negative_cache:
+            if statistics is not None:
+                statistics.record_match(None, True)
             return None
+        match = self.cache.get(key)
+        if match is not None:
+            if statistics is not None:
+                statistics.record_match(match[0], True)
+            return match
+        matchers = self._matchers
+        if matchers is None:
+            matchers = self._matchers = self._partition()
+        matcher = matchers.get((method, subdomain))
+        if matcher is not None:
+            match = matcher.match(path)
+        if match is None:
+            self.negative_cache[key] = True
+        else:
+            self.cache[key] = match
+        if statistics is not None:
+            statistics.record_match(match and match[0], False)
+        return match
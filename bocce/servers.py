@@ -0,0 +1,549 @@
+# standard libraries
+import os
+import asyncio
+import concurrent.futures
+import email.utils
+import http
+import io
+import logging
+import signal
+import ssl
+import sys
+import threading
+import time
+import urllib.parse
+import warnings
+# third party libraries
+import cherrypy
+import cherrypy._cpwsgi_server
+# first party libraries
+from . import (prefork, )
+
+
+__where__ = os.path.dirname(os.path.abspath(__file__))
+
+
+def sudo_ids():
+    uid = int(os.environ['SUDO_UID'])
+    gid = int(os.environ['SUDO_GID'])
+    if uid == 0:
+        uid = 1000
+    if gid == 0:
+        gid = 1000
+    return uid, gid
+
+
+class Backend:
+    """ Serves a WSGI application on some interfaces until it is stopped.
+        
+        listeners, if given, are sockets already bound for each interface, as
+        in a pre-forked worker; otherwise the backend binds its own. Once it 
+        accepts connections the backend calls prefork.notify_ready; on SIGTERM
+        it stops accepting and gives in-flight requests up to shutdown_timeout
+        seconds to finish.
+    
+    """
+    def serve(self, application, interfaces, listeners=None,
+              drop_privileges=False, shutdown_timeout=None):
+        raise NotImplementedError
+
+
+class CherryPyBackend(Backend):
+    
+    def serve(self, application, interfaces, listeners=None,
+              drop_privileges=False, shutdown_timeout=None):
+        if tuple(cherrypy.__version__.split('.')) < ('3', '8', '0'):
+            warnings.warn(
+                'Upgrade to a newer version of cherrypy (> v3.8.0) to avoid '
+                'buggy behavior.'
+            )
+        
+        cherrypy.tree.graft(application, '/')
+        cherrypy.server.unsubscribe()
+        
+        for index, interface in enumerate(interfaces):
+            host = interface.get('host', '127.0.0.1')
+            port = interface.get('port', 8080)
+            threads = interface.get('threads', 16)
+            ssl_certificate = interface.get('ssl_certificate', None)
+            ssl_private_key = interface.get('ssl_private_key', None)
+            
+            if listeners is None:
+                server = cherrypy._cpserver.Server()
+            else:
+                server = _ListenerServerAdapter(listeners[index])
+            server.socket_host = host
+            server.socket_port = port
+            server.thread_pool = threads
+            if shutdown_timeout is not None:
+                server.shutdown_timeout = shutdown_timeout
+            
+            if ssl_certificate is not None and ssl_private_key is not None:
+                server.ssl_module = 'builtin'
+                server.ssl_certificate = ssl_certificate
+                server.ssl_private_key = ssl_private_key
+            
+            server.subscribe()
+        
+        cherrypy.log.access_log.setLevel(logging.ERROR)
+        cherrypy.log.error_log.setLevel(logging.ERROR)
+        cherrypy.engine.autoreload.unsubscribe()
+        
+        if drop_privileges:
+            uid, gid = sudo_ids()
+            cherrypy.process.plugins.DropPrivileges(cherrypy.engine, uid=uid, gid=gid).subscribe()
+        
+        # SIGTERM stops the engine gracefully rather than killing the process
+        signal.signal(signal.SIGTERM, lambda *arguments: cherrypy.engine.exit())
+        cherrypy.engine.start()
+        prefork.notify_ready()
+        cherrypy.engine.block()
+
+
+class _ListenerServer(cherrypy._cpwsgi_server.CPWSGIServer):
+    """ A cherrypy WSGI server which accepts on an already bound socket. """
+    def __init__(self, server_adapter, listener):
+        super().__init__(server_adapter)
+        self.listener = listener
+        self.draining = False
+    
+    @property
+    def can_add_keepalive_connection(self):
+        # while draining, responses close their connections
+        if self.draining:
+            return False
+        return super().can_add_keepalive_connection
+    
+    def bind(self, family, type, proto=0):
+        self.socket = self.listener
+        self.bind_addr = self.resolve_real_bind_addr(self.listener)
+        return self.socket
+
+
+class _ListenerServerAdapter(cherrypy._cpserver.Server):
+    
+    def __init__(self, listener):
+        super().__init__()
+        self.listener = listener
+    
+    def httpserver_from_self(self, httpserver=None):
+        return _ListenerServer(self, self.listener), self.bind_addr
+    
+    def start(self):
+        # as cherrypy's start, less the check that the port is free: the
+        # listener holds it already
+        self.interrupt = None
+        self.httpserver, self.bind_addr = self.httpserver_from_self()
+        thread = threading.Thread(target=self._start_http_thread)
+        thread.name = 'HTTPServer ' + thread.name
+        thread.start()
+        self.wait()
+        self.running = True
+        self.bus.log('Serving on {}'.format(self.description))
+    
+    # seconds for which connections are closed by their next response, before
+    # those still idle are closed
+    linger = 1.0
+    
+    def stop(self):
+        # as cherrypy's stop, less the wait for the port to be freed: other 
+        # workers still hold the listener
+        if self.running:
+            self.httpserver.draining = True
+            time.sleep(min(self.linger, self.shutdown_timeout))
+            self.httpserver.stop()
+            self.running = False
+            self.bus.log('HTTP Server {} shut down'.format(self.httpserver))
+
+
+class AsyncioBackend(Backend):
+    
+    def __init__(self, threads=None, **kwargs):
+        self.threads = threads
+        self.kwargs = kwargs
+    
+    def serve(self, application, interfaces, listeners=None,
+              drop_privileges=False, shutdown_timeout=None):
+        if listeners is None:
+            listeners = [
+                prefork.listen(
+                    interface.get('host', '127.0.0.1'),
+                    interface.get('port', 8080),
+                )
+                for interface in interfaces
+            ]
+        ssl_contexts = []
+        for interface in interfaces:
+            ssl_certificate = interface.get('ssl_certificate', None)
+            ssl_private_key = interface.get('ssl_private_key', None)
+            if ssl_certificate is not None and ssl_private_key is not None:
+                context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+                context.load_cert_chain(ssl_certificate, ssl_private_key)
+                ssl_contexts.append(context)
+            else:
+                ssl_contexts.append(None)
+        if drop_privileges:
+            uid, gid = sudo_ids()
+            os.setgid(gid)
+            os.setuid(uid)
+        threads = self.threads
+        if threads is None:
+            threads = max(interface.get('threads', 16) for interface in interfaces)
+        kwargs = dict(self.kwargs)
+        if shutdown_timeout is not None:
+            kwargs['shutdown_timeout'] = shutdown_timeout
+        server = HTTPServer(application, threads, **kwargs)
+        asyncio.run(server.serve(listeners, ssl_contexts))
+
+
+backends = {
+    'cherrypy': CherryPyBackend,
+    'asyncio': AsyncioBackend,
+}
+
+
+class _RequestError(Exception):
+    
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+class HTTPServer:
+    """ An asyncio HTTP/1.1 server for a WSGI application.
+        
+        Connections live on the event loop, so an idle keep-alive connection
+        costs a socket and a buffer rather than a thread. The application runs
+        in a pool of threads; once max_pending requests are waiting for it,
+        connections are not read any further. Pipelined requests are answered
+        in order.
+    
+    """
+    def __init__(self, application, threads=16, max_pending=1024,
+                 keep_alive_timeout=75.0, max_header_size=65536,
+                 max_body_size=2**26, buffer_size=65536, shutdown_timeout=10.0,
+                 linger=1.0):
+        self.application = application
+        self.threads = threads
+        self.max_pending = max_pending
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.buffer_size = buffer_size
+        self.shutdown_timeout = shutdown_timeout
+        self.linger = linger
+        # maps the writer of every open connection to whether it is busy
+        self.connections = {}
+        self.loop = None
+        self._date = (None, None)
+    
+    async def serve(self, listeners, ssl_contexts=None):
+        loop = self.loop = asyncio.get_running_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            self.threads, thread_name_prefix='bocce',
+        )
+        self.pending = asyncio.Semaphore(self.max_pending)
+        self.stopping = asyncio.Event()
+        if ssl_contexts is None:
+            ssl_contexts = [None]*len(listeners)
+        servers = []
+        for listener, ssl_context in zip(listeners, ssl_contexts):
+            server = await asyncio.start_server(
+                self._serve_connection, sock=listener, ssl=ssl_context,
+                limit=self.max_header_size,
+            )
+            servers.append(server)
+        signal_numbers = ()
+        if threading.current_thread() is threading.main_thread():
+            signal_numbers = (signal.SIGTERM, signal.SIGINT)
+        for signal_number in signal_numbers:
+            loop.add_signal_handler(signal_number, self.stopping.set)
+        prefork.notify_ready()
+        try:
+            await self.stopping.wait()
+        finally:
+            for signal_number in signal_numbers:
+                loop.remove_signal_handler(signal_number)
+            for server in servers:
+                server.close()
+            await self._drain()
+            self.executor.shutdown(wait=False)
+    
+    def stop(self):
+        """ Stop serving; safe to call from any thread. """
+        self.loop.call_soon_threadsafe(self.stopping.set)
+    
+    async def _drain(self):
+        # responses now close their connections; after linger seconds, close
+        # connections which are still idle and give busy ones a while to finish
+        start = time.monotonic()
+        deadline = start + self.shutdown_timeout
+        linger = start + min(self.linger, self.shutdown_timeout)
+        while len(self.connections) > 0 and time.monotonic() < deadline:
+            if time.monotonic() >= linger:
+                for writer, busy in list(self.connections.items()):
+                    if not busy:
+                        writer.close()
+            await asyncio.sleep(0.05)
+        for writer in list(self.connections):
+            writer.close()
+    
+    async def _serve_connection(self, reader, writer):
+        connections = self.connections
+        connections[writer] = False
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b'\r\n\r\n'), self.keep_alive_timeout
+                    )
+                except asyncio.LimitOverrunError:
+                    self._write_error(writer, 431)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    break
+                connections[writer] = True
+                try:
+                    keep_alive = await self._serve_request(head, reader, writer)
+                except _RequestError as error:
+                    self._write_error(writer, error.status_code)
+                    break
+                connections[writer] = False
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            connections.pop(writer, None)
+            writer.close()
+    
+    async def _serve_request(self, head, reader, writer):
+        lines = head.lstrip(b'\r\n').split(b'\r\n')[:-2]
+        try:
+            method, target, version = lines[0].decode('latin-1').split(' ')
+        except (IndexError, ValueError):
+            raise _RequestError(400)
+        if version not in ('HTTP/1.1', 'HTTP/1.0'):
+            raise _RequestError(505)
+        environment = self._environment(method, target, version, lines[1:], writer)
+        connection = environment.get('HTTP_CONNECTION', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = 'close' not in connection
+        else:
+            keep_alive = 'keep-alive' in connection
+        if 'chunked' in environment.get('HTTP_TRANSFER_ENCODING', '').lower():
+            body = await self._read_chunked(reader)
+            environment['CONTENT_LENGTH'] = str(len(body))
+        elif 'CONTENT_LENGTH' in environment:
+            try:
+                content_length = int(environment['CONTENT_LENGTH'])
+            except ValueError:
+                raise _RequestError(400)
+            if content_length < 0:
+                raise _RequestError(400)
+            if content_length > self.max_body_size:
+                raise _RequestError(413)
+            if environment.get('HTTP_EXPECT', '').lower() == '100-continue':
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            body = await reader.readexactly(content_length)
+        else:
+            body = b''
+        environment['wsgi.input'] = io.BytesIO(body)
+        async with self.pending:
+            try:
+                response = await self.loop.run_in_executor(
+                    self.executor, self._call_application, environment
+                )
+            except Exception as exception:
+                self.loop.call_exception_handler({
+                    'message': 'Unhandled exception in the WSGI application',
+                    'exception': exception,
+                })
+                raise _RequestError(500)
+        return await self._write_response(
+            writer, method, version, keep_alive, *response
+        )
+    
+    def _environment(self, method, target, version, header_lines, writer):
+        if not target.startswith('/'):
+            # the absolute form, as sent to proxies
+            target = urllib.parse.urlsplit(target)._replace(
+                scheme='', netloc=''
+            ).geturl() or '/'
+        path, _, query = target.partition('?')
+        server_address = writer.get_extra_info('sockname')
+        client_address = writer.get_extra_info('peername') or ('', 0)
+        if writer.get_extra_info('sslcontext') is None:
+            scheme = 'http'
+        else:
+            scheme = 'https'
+        environment = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': urllib.parse.unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': server_address[0],
+            'SERVER_PORT': str(server_address[1]),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': client_address[0],
+            'REMOTE_PORT': str(client_address[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scheme,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for line in header_lines:
+            name, separator, value = line.partition(b':')
+            if separator != b':' or name != name.strip() or len(name) == 0:
+                raise _RequestError(400)
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.strip().decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = name
+            else:
+                key = 'HTTP_{}'.format(name)
+            if key in environment:
+                separator = '; ' if key == 'HTTP_COOKIE' else ','
+                environment[key] = '{}{}{}'.format(environment[key], separator, value)
+            else:
+                environment[key] = value
+        return environment
+    
+    async def _read_chunked(self, reader):
+        body = bytearray()
+        while True:
+            try:
+                line = await reader.readuntil(b'\r\n')
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except (asyncio.LimitOverrunError, ValueError):
+                raise _RequestError(400)
+            if size == 0:
+                break
+            if len(body) + size > self.max_body_size:
+                raise _RequestError(413)
+            body += await reader.readexactly(size)
+            if await reader.readexactly(2) != b'\r\n':
+                raise _RequestError(400)
+        # trailers are read and dropped
+        try:
+            while await reader.readuntil(b'\r\n') != b'\r\n':
+                continue
+        except asyncio.LimitOverrunError:
+            raise _RequestError(400)
+        return bytes(body)
+    
+    def _call_application(self, environment):
+        # run in the pool; the body is buffered up to buffer_size and the rest
+        # is left to be read as it is written
+        started = []
+        chunks = []
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and len(started) > 0:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [status, headers]
+            return chunks.append
+        result = self.application(environment, start_response)
+        iterator = iter(result)
+        size = 0
+        for chunk in iterator:
+            if len(chunk) > 0:
+                chunks.append(chunk)
+                size += len(chunk)
+            if size >= self.buffer_size:
+                return started[0], started[1], chunks, (result, iterator)
+        if hasattr(result, 'close'):
+            result.close()
+        return started[0], started[1], chunks, None
+    
+    async def _write_response(self, writer, method, version, keep_alive,
+                              status, headers, chunks, remainder):
+        status_code = int(status[:3])
+        if self.stopping.is_set():
+            keep_alive = False
+        has_body = (
+            method != 'HEAD' and status_code >= 200 and
+            status_code not in (204, 304)
+        )
+        names = set()
+        lines = ['HTTP/1.1 {}\r\n'.format(status)]
+        for name, value in headers:
+            lower_name = name.lower()
+            names.add(lower_name)
+            if lower_name == 'connection' and 'close' in value.lower():
+                keep_alive = False
+            lines.append('{}: {}\r\n'.format(name, value))
+        if 'date' not in names:
+            lines.append('Date: {}\r\n'.format(self._http_date()))
+        chunked = False
+        if 'content-length' not in names and has_body:
+            if remainder is None:
+                content_length = sum(len(chunk) for chunk in chunks)
+                lines.append('Content-Length: {}\r\n'.format(content_length))
+            elif version == 'HTTP/1.1':
+                chunked = True
+                lines.append('Transfer-Encoding: chunked\r\n')
+            else:
+                keep_alive = False
+        if 'connection' not in names:
+            if not keep_alive:
+                lines.append('Connection: close\r\n')
+            elif version == 'HTTP/1.0':
+                lines.append('Connection: keep-alive\r\n')
+        lines.append('\r\n')
+        # the head and the buffered body go out in one write, and so usually
+        # in one segment
+        parts = [''.join(lines).encode('latin-1')]
+        if has_body:
+            parts.extend(self._frame(chunks, chunked))
+        writer.write(b''.join(parts))
+        if remainder is not None:
+            result, iterator = remainder
+            try:
+                while True:
+                    await writer.drain()
+                    chunk = await self.loop.run_in_executor(
+                        self.executor, next, iterator, None
+                    )
+                    if chunk is None:
+                        break
+                    if has_body:
+                        writer.write(b''.join(self._frame([chunk], chunked)))
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return keep_alive
+    
+    @staticmethod
+    def _frame(chunks, chunked):
+        for chunk in chunks:
+            if len(chunk) == 0:
+                continue
+            if chunked:
+                yield b'%x\r\n' % len(chunk)
+                yield chunk
+                yield b'\r\n'
+            else:
+                yield chunk
+    
+    def _write_error(self, writer, status_code):
+        status = http.HTTPStatus(status_code)
+        writer.write(
+            'HTTP/1.1 {} {}\r\nContent-Length: 0\r\nConnection: close\r\n'
+            'Date: {}\r\n\r\n'.format(
+                status.value, status.phrase, self._http_date()
+            ).encode('latin-1')
+        )
+    
+    def _http_date(self):
+        # formatted at most once a second
+        now = int(time.time())
+        second, date = self._date
+        if second != now:
+            date = email.utils.formatdate(now, usegmt=True)
+            self._date = (now, date)
+        return date
@@ -159,7 +159,6 @@ class NotFoundHandler(exceptions.Handler):
         response.body.html = exception_template.format(
             status=response.status, message=bleach.clean(message),
         )
-        response.enable_compression(request)
 
 
 class MethodNotAllowedHandler(exceptions.Handler):
@@ -196,6 +195,10 @@ class NotModifiedHandler(exceptions.Handler):
         response.status_code = 304
 
 
+# stateless, so one instance is returned for every request
+not_modified_handler = NotModifiedHandler()
+
+
 class Path:
     
     def __init__(self, path):
@@ -383,7 +386,7 @@ class Handler:
     
     def __call__(self, request, response, configuration):
         if request.http.method not in ('HEAD', 'GET'):
-            raise MethodNotAllowedHandler()
+            return MethodNotAllowedHandler()
         # construct full path, joining with any included as part of url
         if self.path.is_file:
             path = self.path
@@ -398,17 +401,17 @@ class Handler:
                 try:
                     path = self.path.join(subpath)
                 except OSError:
-                    raise NotFoundHandler()
+                    return NotFoundHandler()
         # if the full path is a file, serve it; else, either serve directory html
         # if directories are exposed, or throw a 403
         if path.is_file:
             # throw 403 if the path is above the mounting path in the filesystem
             if path.is_above(self.path):# and self.path != path:
                 #raise ForbiddenHandler()
-                raise NotFoundHandler()
+                return NotFoundHandler()
             # set etag header and check if client has cached this content
             if path.etag in request.cache.if_none_match:
-                raise NotModifiedHandler()
+                return not_modified_handler
             # see if we have compressed content, and if not, create it
             compressed_path = path.compressed_path
             # check if we can return compressed content
@@ -445,6 +448,6 @@ class Handler:
                 )
             else:
                 #raise ForbiddenHandler()
-                raise NotFoundHandler()
+                return NotFoundHandler()
         else:
-            raise NotFoundHandler()
+            return NotFoundHandler()
@@ -0,0 +1,171 @@
+# standard libraries
+import os
+import bisect
+import threading
+# third party libraries
+pass
+# first party libraries
+pass
+
+
+__where__ = os.path.dirname(os.path.abspath(__file__))
+
+
+latency_buckets = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, float('inf'),
+)
+
+
+class Accumulators:
+    """ One dictionary per thread, so that every thread records into its own
+        without taking a lock; all returns those of every thread, to merge on
+        read. Statistics and metrics.Metric keep their counters in them.
+    
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._accumulators = []
+        self._lock = threading.Lock()
+    
+    def get(self):
+        """ Return the calling thread's dictionary. """
+        try:
+            return self._local.accumulator
+        except AttributeError:
+            accumulator = self._local.accumulator = {}
+            with self._lock:
+                self._accumulators.append(accumulator)
+            return accumulator
+    
+    def all(self):
+        with self._lock:
+            return list(self._accumulators)
+    
+    def reset(self):
+        with self._lock:
+            self._accumulators = []
+            self._local = threading.local()
+
+
+class _RouteCounters:
+    
+    __slots__ = (
+        'hits', 'cache_hits', 'cache_misses', 'latency_count', 'latency_sum',
+        'latency_buckets', 'status_codes',
+    )
+    
+    def __init__(self, number_buckets):
+        self.hits = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0]*number_buckets
+        self.status_codes = {}
+
+
+class Statistics:
+    """ Per-route match, cache, latency and status code counters.
+        
+        Every thread records into its own accumulator, so recording takes no
+        lock; snapshot merges the accumulators of all threads on read.  A route
+        of None counts requests that did not match any route.
+    
+    """
+    def __init__(self, buckets=latency_buckets):
+        self.buckets = tuple(buckets)
+        self._accumulators = Accumulators()
+    
+    def _counters(self, route):
+        accumulator = self._accumulators.get()
+        try:
+            return accumulator[route]
+        except KeyError:
+            counters = accumulator[route] = _RouteCounters(len(self.buckets))
+            return counters
+    
+    def record_match(self, route, cached):
+        counters = self._counters(route)
+        counters.hits += 1
+        if cached:
+            counters.cache_hits += 1
+        else:
+            counters.cache_misses += 1
+    
+    def record_response(self, route, status_code, duration):
+        counters = self._counters(route)
+        counters.latency_count += 1
+        counters.latency_sum += duration
+        counters.latency_buckets[bisect.bisect_left(self.buckets, duration)] += 1
+        status_codes = counters.status_codes
+        status_codes[status_code] = status_codes.get(status_code, 0) + 1
+    
+    def reset(self):
+        self._accumulators.reset()
+    
+    def snapshot(self):
+        merged = {}
+        for accumulator in self._accumulators.all():
+            for route, counters in list(accumulator.items()):
+                if route not in merged:
+                    merged[route] = _RouteCounters(len(self.buckets))
+                totals = merged[route]
+                totals.hits += counters.hits
+                totals.cache_hits += counters.cache_hits
+                totals.cache_misses += counters.cache_misses
+                totals.latency_count += counters.latency_count
+                totals.latency_sum += counters.latency_sum
+                for index, count in enumerate(counters.latency_buckets):
+                    totals.latency_buckets[index] += count
+                for status_code, count in list(counters.status_codes.items()):
+                    totals.status_codes[status_code] = \
+                        totals.status_codes.get(status_code, 0) + count
+        snapshot = []
+        for route, totals in merged.items():
+            if route is None:
+                description = {'path': None, 'name': None, 'methods': None}
+            else:
+                description = {
+                    'path': '/{}'.format(route.path),
+                    'name': route.name,
+                    'methods': sorted(route.methods, key=repr),
+                }
+            buckets = {}
+            cumulative_count = 0
+            for bucket, count in zip(self.buckets, totals.latency_buckets):
+                cumulative_count += count
+                buckets[repr(bucket) if bucket != float('inf') else '+Inf'] = \
+                    cumulative_count
+            description.update({
+                'hits': totals.hits,
+                'cache_hits': totals.cache_hits,
+                'cache_misses': totals.cache_misses,
+                'latency': {
+                    'count': totals.latency_count,
+                    'sum': totals.latency_sum,
+                    'buckets': buckets,
+                },
+                'status_codes': {
+                    str(status_code): count
+                    for status_code, count in sorted(totals.status_codes.items())
+                },
+            })
+            snapshot.append(description)
+        snapshot.sort(key=lambda description: -description['hits'])
+        return snapshot
+
+
+class Handler:
+    
+    def __init__(self, statistics, routes=None):
+        self.statistics = statistics
+        self.routes = routes
+    
+    def __call__(self, request, response, configuration):
+        response.headers['Cache-Control'] = 'no-store'
+        response.body.json['routes'] = self.statistics.snapshot()
+        if self.routes is not None:
+            response.body.json['cache'] = self.routes.cache.statistics
+            response.body.json['negative_cache'] = \
+                self.routes.negative_cache.statistics
@@ -0,0 +1,72 @@
+# standard libraries
+import os
+import time
+# third party libraries
+pass
+# first party libraries
+pass
+
+
+__where__ = os.path.dirname(os.path.abspath(__file__))
+
+
+# in the order Application.__call__ goes through them
+phases = ('parse', 'route', 'before', 'handler', 'after', 'serialize', )
+
+
+class Timing:
+    """ Time the phases of every request an Application serves.
+        
+        Each request's durations, in seconds by phase name, are passed to
+        sink(request, response, durations), if given, and sent as a
+        Server-Timing header, if header is true. A phase cut short by an
+        exception is counted in the next one that completes; handler includes
+        any exception handler.
+    
+    """
+    def __init__(self, header=True, sink=None):
+        self.header = header
+        self.sink = sink
+    
+    def start(self, start):
+        return Timer(self, start)
+
+
+class Timer:
+    
+    __slots__ = ('timing', 'last', 'durations', )
+    
+    def __init__(self, timing, start):
+        self.timing = timing
+        self.last = start
+        self.durations = {}
+    
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.durations[phase] = self.durations.get(phase, 0.0) + now - self.last
+        self.last = now
+    
+    @property
+    def server_timing(self):
+        return ', '.join(
+            '{};dur={:.3f}'.format(phase, 1e3*duration)
+            for phase, duration in self.durations.items()
+        )
+    
+    def start_response(self, request, response, start_response):
+        """ Start the response, timing its serialization, and return its body. """
+        def timed_start_response(status, headers, *exc_info):
+            # the headers are listed once the body is serialized
+            self.lap('serialize')
+            if self.timing.header:
+                headers.append(('Server-Timing', self.server_timing))
+            return start_response(status, headers, *exc_info)
+        # logging and statistics belong to no phase
+        self.last = time.perf_counter()
+        body = response.start(timed_start_response)
+        if self.timing.sink is not None:
+            try:
+                self.timing.sink(request, response, self.durations)
+            except:
+                pass
+        return body
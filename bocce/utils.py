@@ -5,6 +5,7 @@ import collections
 import collections.abc
 import datetime
 import json
+import math
 import multiprocessing
 import threading
 import traceback
@@ -202,6 +203,247 @@ class LRUCache(collections.abc.MutableMapping):
         return len(self._cache)
 
 
+_vacant = object()
+
+
+class FrequencySketch:
+    """ A count-min sketch of recent key frequencies for TinyLFU admission.
+        
+        Counters are stored in a bytearray, saturate at 15, and are halved 
+        once every ``sample_size`` increments so that the estimate follows 
+        changes in popularity.  Updates take no lock; an occasional lost 
+        increment only makes an estimate slightly low.
+    
+    """
+    _halved = bytes(count >> 1 for count in range(256))
+    
+    def __init__(self, size):
+        width = 16
+        while width < size:
+            width *= 2
+        self._mask = width - 1
+        self._width = width
+        self._table = bytearray(4*width)
+        self._sample_size = 10*width
+        self._additions = 0
+        self._lock = threading.Lock()
+    
+    def _indices(self, key):
+        h = hash(key)
+        h ^= h >> 16
+        mask = self._mask
+        width = self._width
+        return (
+            ((h*0x9E3779B1) >> 8) & mask,
+            width + (((h*0x85EBCA77) >> 8) & mask),
+            2*width + (((h*0xC2B2AE3D) >> 8) & mask),
+            3*width + (((h*0x27D4EB2F) >> 8) & mask),
+        )
+    
+    def increment(self, key):
+        table = self._table
+        for index in self._indices(key):
+            if table[index] < 15:
+                table[index] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self.reset()
+    
+    def frequency(self, key):
+        table = self._table
+        a, b, c, d = self._indices(key)
+        return min(table[a], table[b], table[c], table[d])
+    
+    def reset(self):
+        with self._lock:
+            if self._additions < self._sample_size:
+                return
+            self._table = self._table.translate(self._halved)
+            self._additions = 0
+
+
+class _ClockShard:
+    
+    __slots__ = (
+        'lock', 'capacity', 'entries', 'ring', 'hand', 'hits', 'misses', 
+        'evictions', 'rejections', 
+    )
+    
+    def __init__(self, capacity):
+        self.lock = threading.Lock()
+        self.capacity = capacity
+        # key => [value, referenced, slot in ring]
+        self.entries = {}
+        self.ring = []
+        self.hand = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+    
+    def set(self, key, value, sketch=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[0] = value
+                entry[1] = True
+                return
+            if self.capacity <= 0:
+                return
+            if len(self.ring) < self.capacity:
+                self.ring.append(key)
+                slot = len(self.ring) - 1
+            else:
+                slot = self.sweep()
+                victim = self.ring[slot]
+                if victim is not _vacant:
+                    # only displace the victim if the newcomer is more popular
+                    if sketch is not None:
+                        if sketch.frequency(key) <= sketch.frequency(victim):
+                            self.rejections += 1
+                            return
+                    del self.entries[victim]
+                    self.evictions += 1
+                self.ring[slot] = key
+            self.entries[key] = [value, False, slot]
+    
+    def sweep(self):
+        # advance the clock hand, clearing reference bits, until an entry that
+        # has not been read since the last pass (or a vacant slot) is found
+        ring = self.ring
+        entries = self.entries
+        hand = self.hand
+        while True:
+            key = ring[hand]
+            if key is _vacant or entries[key][1] == False:
+                break
+            entries[key][1] = False
+            hand = (hand + 1) % len(ring)
+        self.hand = (hand + 1) % len(ring)
+        return hand
+    
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key)
+            self.ring[entry[2]] = _vacant
+    
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.ring = []
+            self.hand = 0
+
+
+class ClockCache(collections.abc.MutableMapping):
+    """ A thread-safe, approximately least-recently-used cache.
+        
+        Keys are spread across independently locked shards.  Reads take no lock
+        and never reorder anything; they only set a reference bit, which the 
+        CLOCK hand clears as it looks for an entry to evict on insertion.  Each
+        shard holds at most ``ceil(size/shards)`` entries.
+        
+        With ``admission=True``, every lookup is recorded in a FrequencySketch 
+        and a full shard only admits a new key if it has been requested more 
+        often than the entry it would evict (TinyLFU), so a stream of one-off
+        keys cannot flush the frequently used ones.
+    
+    """
+    def __init__(self, size=None, shards=16, admission=False):
+        if not isinstance(size, (int, float)):
+            raise TypeError()
+        else:
+            if size < 0:
+                raise ValueError()
+        if shards < 1 or shards & (shards - 1):
+            raise ValueError('The variable shards must be a power of two.')
+        self._size = size
+        self._mask = shards - 1
+        self._shards = self._create_shards()
+        self._admission = admission
+        self._sketch = self._create_sketch()
+    
+    def _create_sketch(self):
+        if self._admission:
+            return FrequencySketch(self._size)
+        else:
+            return None
+    
+    def _create_shards(self):
+        number_shards = self._mask + 1
+        capacity = int(math.ceil(self._size/float(number_shards)))
+        return tuple(_ClockShard(capacity) for _ in range(number_shards))
+    
+    def _shard(self, key):
+        return self._shards[hash(key) & self._mask]
+    
+    def get(self, key, default=None):
+        shard = self._shards[hash(key) & self._mask]
+        if self._sketch is not None:
+            self._sketch.increment(key)
+        entry = shard.entries.get(key)
+        if entry is None:
+            shard.misses += 1
+            return default
+        shard.hits += 1
+        entry[1] = True
+        return entry[0]
+    
+    def __getitem__(self, key):
+        value = self.get(key, _vacant)
+        if value is _vacant:
+            raise KeyError(key)
+        return value
+    
+    def __setitem__(self, key, value):
+        self._shard(key).set(key, value, self._sketch)
+    
+    def __delitem__(self, key):
+        self._shard(key).delete(key)
+    
+    def __contains__(self, key):
+        return key in self._shard(key).entries
+    
+    def __iter__(self):
+        for shard in self._shards:
+            yield from list(shard.entries)
+    
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+    
+    def flush(self):
+        for shard in self._shards:
+            shard.clear()
+    
+    @property
+    def size(self):
+        return self._size
+    
+    @size.setter
+    def size(self, size):
+        shards = self._shards
+        self._size = size
+        self._shards = self._create_shards()
+        self._sketch = self._create_sketch()
+        for shard in shards:
+            for key, entry in list(shard.entries.items()):
+                self._shard(key).set(key, entry[0])
+    
+    @property
+    def statistics(self):
+        hits = sum(shard.hits for shard in self._shards)
+        misses = sum(shard.misses for shard in self._shards)
+        evictions = sum(shard.evictions for shard in self._shards)
+        rejections = sum(shard.rejections for shard in self._shards)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'rejections': rejections,
+            'length': len(self),
+            'size': self.size,
+        }
+
+
 class When:
     
     @staticmethod
@@ -0,0 +1,29 @@
+# standard libraries
+import io
+# third party libraries
+import pytest
+# first party libraries
+pass
+
+
+@pytest.fixture
+def wsgi_request():
+    """ A function serving a GET request for path with a WSGI application and
+        returning its status, headers (as a dict) and body.
+    
+    """
+    def request(application, path, headers=None):
+        environment = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 
+            'HTTP_HOST': 'localhost', 'SERVER_PROTOCOL': 'HTTP/1.1', 
+            'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        }
+        environment.update(headers or {})
+        started = {}
+        def start_response(status, headers):
+            started['status'] = status
+            started['headers'] = dict(headers)
+        body = b''.join(application(environment, start_response))
+        return started['status'], started['headers'], body
+    return request
@@ -0,0 +1,92 @@
+# standard libraries
+import threading
+import time
+# third party libraries
+import pytest
+# first party libraries
+import bocce
+import bocce.admission as admission
+
+
+def test_waiters_are_admitted_by_priority_then_shed():
+    controller = admission.AdmissionController(limit=1, max_queue=2, max_wait=5.0)
+    controller.set_priority('/health', 0)
+    assert controller.acquire({'PATH_INFO': '/'})
+    order = []
+    def wait(path):
+        if controller.acquire({'PATH_INFO': path}):
+            order.append(path)
+    threads = [
+        threading.Thread(target=wait, args=(path, )) for path in ('/slow', '/health')
+    ]
+    for thread in threads:
+        thread.start()
+        while controller.queued < threads.index(thread) + 1:
+            time.sleep(0.01)
+    # the queue is full
+    assert not controller.acquire({'PATH_INFO': '/other'})
+    controller.release()
+    threads[1].join()
+    controller.release()
+    threads[0].join()
+    assert order == ['/health', '/slow']
+    controller.release()
+    assert controller.statistics['in_flight'] == 0
+    assert controller.statistics['shed'] == [
+        {'priority': 1, 'reason': 'queue_full', 'count': 1},
+    ]
+
+
+def test_application_sheds_requests_that_wait_too_long(wsgi_request):
+    application = bocce.Application()
+    started = threading.Event()
+    finish = threading.Event()
+    def handler(request, response, configuration):
+        started.set()
+        finish.wait(5.0)
+    application.routes.add_handler('/', handler)
+    application.enable_admission_control(limit=1, max_queue=1, max_wait=0.05)
+    application.expose_metrics()
+    application.configure()
+    thread = threading.Thread(target=wsgi_request, args=(application, '/'))
+    thread.start()
+    started.wait(5.0)
+    status, headers, _ = wsgi_request(application, '/')
+    assert status == '503 Service Unavailable'
+    assert headers['Retry-After'] == '1'
+    finish.set()
+    thread.join()
+    _, _, body = wsgi_request(application, '/metrics')
+    assert b'bocce_requests_shed_total{priority="1",reason="timeout"} 1\n' in body
+
+
+def test_failed_responses_release_their_slot(wsgi_request):
+    application = bocce.Application()
+    def broken(request, response, configuration):
+        response.body.json = {'value': object()}
+    def ok(request, response, configuration):
+        response.body.json = {'ok': True}
+    application.routes.add_handler('/broken', broken)
+    application.routes.add_handler('/ok', ok)
+    application.enable_admission_control(limit=2, max_queue=0, max_wait=0.0)
+    application.configure()
+    for _ in range(2):
+        try:
+            wsgi_request(application, '/broken')
+        except TypeError:
+            pass
+    assert wsgi_request(application, '/ok')[0] == '200 OK'
+    assert application.admission.statistics['in_flight'] == 0
+
+
+def test_admission_control_enabled_after_configure_has_priorities():
+    application = bocce.Application()
+    def health(request, response, configuration):
+        pass
+    health.priority = 0
+    application.routes.add_handler('/health', health)
+    application.configure()
+    controller = application.enable_admission_control()
+    assert controller.priority({'PATH_INFO': '/health'}) == 0
+    with pytest.raises(RuntimeError, match='before configure'):
+        application.expose_metrics()
@@ -0,0 +1,69 @@
+# standard libraries
+import asyncio
+import json
+import threading
+# third party libraries
+pass
+# first party libraries
+import bocce
+
+
+def request(application, path, method='GET', body=b'', headers=()):
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'localhost')] + list(headers),
+        'server': ('localhost', 80),
+        'client': ('127.0.0.1', 12345),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+    async def receive():
+        return messages.pop(0)
+    async def send(message):
+        sent.append(message)
+    asyncio.run(application(scope, receive, send))
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return sent[0]['status'], dict(sent[0]['headers']), body
+
+
+def test_async_handlers_and_middleware_are_awaited():
+    application = bocce.AsyncApplication()
+    async def before(request, response, configuration):
+        await asyncio.sleep(0)
+        response.headers['X-Before'] = 'yes'
+    async def handler(request, response, configuration):
+        await asyncio.sleep(0)
+        response.body.json = {'id': request.segments['id']}
+    handler.before = [before]
+    application.routes.add_handler('/items/{id}', handler)
+    application.configure()
+    status, headers, body = request(application, '/items/7')
+    assert status == 200
+    assert headers[b'x-before'] == b'yes'
+    assert json.loads(body.decode('utf-8')) == {'id': '7'}
+
+
+def test_sync_handlers_run_in_the_thread_pool():
+    application = bocce.AsyncApplication(threads=2)
+    threads = []
+    def handler(request, response, configuration):
+        threads.append(threading.current_thread())
+        response.body.text = request.body.text
+    application.routes.add_handler('/echo', handler, methods=('POST', ))
+    application.configure()
+    status, headers, body = request(application, '/echo', 'POST', b'hello')
+    assert (status, body) == (200, b'hello')
+    assert threads[0] is not threading.main_thread()
+
+
+def test_exceptions_use_the_shared_handlers():
+    application = bocce.AsyncApplication()
+    async def handler(request, response, configuration):
+        raise ValueError
+    application.routes.add_handler('/broken', handler)
+    application.configure()
+    assert request(application, '/missing')[0] == 404
+    assert request(application, '/broken')[0] == 500
@@ -0,0 +1,255 @@
+# standard libraries
+import gzip
+import threading
+import time
+# third party libraries
+pass
+# first party libraries
+import bocce
+import bocce.caching as caching
+import bocce.exceptions as exceptions
+import bocce.middleware as middleware
+
+
+def create_application(cache):
+    application = bocce.Application()
+    calls = []
+    def handler(request, response, configuration):
+        calls.append(request.headers.get('Accept-Language'))
+        response.headers['Vary'] = 'Accept-Language'
+        response.body.json = {'numbers': list(range(100))}
+    handler.after = [middleware.compress]
+    route = application.routes.add_handler('/numbers', handler)
+    cache.install(route, ttl=60.0)
+    application.configure()
+    return application, route, calls
+
+
+def test_hits_are_served_compressed_without_the_handler(wsgi_request):
+    cache = caching.ResponseCache()
+    application, route, calls = create_application(cache)
+    gzip_headers = {'HTTP_ACCEPT_ENCODING': 'gzip', 'HTTP_ACCEPT_LANGUAGE': 'en'}
+    _, _, first = wsgi_request(application, '/numbers', gzip_headers)
+    status, headers, body = wsgi_request(application, '/numbers', gzip_headers)
+    assert status.startswith('200')
+    assert calls == ['en']
+    assert body == first
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Age'] == '0'
+    assert gzip.decompress(body).startswith(b'{"numbers": [0, 1')
+    # the key covers gzip and the headers named by Vary
+    wsgi_request(application, '/numbers', {'HTTP_ACCEPT_LANGUAGE': 'en'})
+    wsgi_request(application, '/numbers', {'HTTP_ACCEPT_LANGUAGE': 'fr'})
+    wsgi_request(application, '/numbers', {'HTTP_ACCEPT_LANGUAGE': 'fr'})
+    assert calls == ['en', 'en', 'fr']
+    statistics = cache.statistics
+    assert (statistics['hits'], statistics['misses']) == (2, 3)
+    assert statistics['length'] == 3
+    assert cache.invalidate(path='/numbers') == 3
+    wsgi_request(application, '/numbers', gzip_headers)
+    assert calls == ['en', 'en', 'fr', 'en']
+
+
+def test_entries_are_evicted_beyond_max_bytes(wsgi_request):
+    cache = caching.ResponseCache(max_bytes=2000)
+    application, route, calls = create_application(cache)
+    for language in ('en', 'fr', 'de', 'en'):
+        wsgi_request(
+            application, '/numbers', {'HTTP_ACCEPT_LANGUAGE': language}
+        )
+    assert cache.bytes <= 2000
+    assert cache.evictions > 0
+    assert calls == ['en', 'fr', 'de', 'en']
+
+
+class Unauthorized(exceptions.Handler):
+    
+    def __call__(self, request, response, configuration):
+        response.status_code = 401
+
+
+def test_cached_responses_are_served_after_the_routes_befores(wsgi_request):
+    cache = caching.ResponseCache()
+    application = bocce.Application()
+    calls = []
+    def authenticate(request, response, configuration):
+        if request.headers.get('X-Api-Key') != 'key':
+            return Unauthorized()
+    def handler(request, response, configuration):
+        calls.append(request.headers.get('Authorization'))
+        response.body.json = {'secret': 42}
+    handler.before = [authenticate]
+    cache.install(application.routes.add_handler('/me', handler))
+    cache.install(
+        application.routes.add_handler('/keyed', handler),
+        headers=('Authorization', ),
+    )
+    application.configure()
+    key = {'HTTP_X_API_KEY': 'key'}
+    assert wsgi_request(application, '/me')[0].startswith('401')
+    assert wsgi_request(application, '/me', key)[2] == b'{"secret": 42}'
+    assert wsgi_request(application, '/me')[0].startswith('401')
+    assert wsgi_request(application, '/me', key)[2] == b'{"secret": 42}'
+    assert calls == [None]
+    # credentials not in the key are neither served from the cache nor stored
+    alice = dict(key, HTTP_AUTHORIZATION='Bearer alice')
+    bob = dict(key, HTTP_AUTHORIZATION='Bearer bob')
+    wsgi_request(application, '/me', alice)
+    wsgi_request(application, '/me', alice)
+    assert calls == [None, 'Bearer alice', 'Bearer alice']
+    assert cache.statistics['length'] == 1
+    # unless they are
+    wsgi_request(application, '/keyed', alice)
+    wsgi_request(application, '/keyed', alice)
+    wsgi_request(application, '/keyed', bob)
+    assert calls[3:] == ['Bearer alice', 'Bearer bob']
+
+
+def create_coalescing_application(coalescer):
+    application = bocce.Application()
+    calls = []
+    release = threading.Event()
+    def handler(request, response, configuration):
+        calls.append(request.url.path)
+        # only the first call is slow
+        if len(calls) == 1:
+            release.wait(5.0)
+        response.body.json = {'calls': len(calls)}
+    handler.after = [middleware.compress]
+    route = application.routes.add_handler('/slow', handler)
+    coalescer.install(route)
+    application.configure()
+    return application, calls, release
+
+
+def test_concurrent_requests_share_the_leaders_response(wsgi_request):
+    coalescer = caching.Coalescer(timeout=5.0)
+    application, calls, release = create_coalescing_application(coalescer)
+    results = []
+    def get():
+        results.append(wsgi_request(application, '/slow'))
+    leader = threading.Thread(target=get)
+    leader.start()
+    while len(calls) == 0:
+        time.sleep(0.001)
+    followers = [threading.Thread(target=get) for _ in range(8)]
+    for follower in followers:
+        follower.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 9
+    assert all(result == results[0] for result in results)
+    assert results[0][2] == b'{"calls": 1}'
+    statistics = coalescer.statistics
+    assert (statistics['leaders'], statistics['shared']) == (1, 8)
+    assert statistics['in_flight'] == 0
+
+
+def test_requests_with_credentials_are_not_coalesced(wsgi_request):
+    coalescer = caching.Coalescer(timeout=5.0)
+    application = bocce.Application()
+    entered = threading.Event()
+    release = threading.Event()
+    def handler(request, response, configuration):
+        entered.set()
+        release.wait(5.0)
+        response.body.json = {'user': request.headers.get('Authorization')}
+    coalescer.install(application.routes.add_handler('/me', handler))
+    application.configure()
+    results = {}
+    def get(user):
+        results[user] = wsgi_request(
+            application, '/me', {'HTTP_AUTHORIZATION': user}
+        )[2]
+    alice = threading.Thread(target=get, args=('alice', ))
+    alice.start()
+    entered.wait(5.0)
+    bob = threading.Thread(target=get, args=('bob', ))
+    bob.start()
+    time.sleep(0.05)
+    release.set()
+    alice.join()
+    bob.join()
+    assert results == {
+        'alice': b'{"user": "alice"}', 'bob': b'{"user": "bob"}',
+    }
+    assert coalescer.statistics['leaders'] == 0
+
+
+def test_a_leader_whose_response_cannot_be_captured_lands(wsgi_request):
+    coalescer = caching.Coalescer(timeout=5.0)
+    application = bocce.Application()
+    def handler(request, response, configuration):
+        response.body.json = {'value': object()}
+    coalescer.install(application.routes.add_handler('/broken', handler))
+    application.configure()
+    for _ in range(2):
+        try:
+            wsgi_request(application, '/broken')
+        except TypeError:
+            pass
+    statistics = coalescer.statistics
+    assert statistics['in_flight'] == 0
+    assert (statistics['leaders'], statistics['fallbacks']) == (2, 0)
+
+
+def test_waiting_too_long_falls_back_to_the_handler(wsgi_request):
+    coalescer = caching.Coalescer(timeout=0.05)
+    application, calls, release = create_coalescing_application(coalescer)
+    leader = threading.Thread(target=wsgi_request, args=(application, '/slow'))
+    leader.start()
+    while len(calls) == 0:
+        time.sleep(0.001)
+    status, headers, body = wsgi_request(application, '/slow')
+    release.set()
+    leader.join()
+    assert body == b'{"calls": 2}'
+    assert coalescer.statistics['fallbacks'] == 1
+
+
+def create_counting_application(cache, fail_on=None, **install):
+    application = bocce.Application()
+    calls = []
+    def handler(request, response, configuration):
+        calls.append(request.url.path)
+        if len(calls) == fail_on:
+            raise RuntimeError('The backend is down.')
+        response.body.json = {'calls': len(calls)}
+    route = application.routes.add_handler('/counted', handler)
+    cache.install(route, ttl=0.01, **install)
+    application.configure()
+    return application, calls
+
+
+def test_stale_entries_are_served_while_they_are_refreshed(wsgi_request):
+    cache = caching.ResponseCache(refresh_workers=1)
+    application, calls = create_counting_application(
+        cache, stale_while_revalidate=60.0
+    )
+    assert wsgi_request(application, '/counted')[2] == b'{"calls": 1}'
+    time.sleep(0.02)
+    status, headers, body = wsgi_request(application, '/counted')
+    assert body == b'{"calls": 1}'
+    deadline = time.monotonic() + 5.0
+    while cache.statistics['refreshes'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert len(calls) == 2
+    assert wsgi_request(application, '/counted')[2] == b'{"calls": 2}'
+    assert cache.statistics['stale_hits'] == 1
+
+
+def test_stale_entries_are_served_instead_of_errors(wsgi_request):
+    cache = caching.ResponseCache()
+    application, calls = create_counting_application(
+        cache, stale_if_error=60.0, fail_on=2
+    )
+    assert wsgi_request(application, '/counted')[2] == b'{"calls": 1}'
+    time.sleep(0.02)
+    status, headers, body = wsgi_request(application, '/counted')
+    assert status.startswith('200')
+    assert body == b'{"calls": 1}'
+    assert len(calls) == 2
+    assert cache.statistics['stale_errors'] == 1
@@ -0,0 +1,33 @@
+# standard libraries
+import io
+import json
+# third party libraries
+pass
+# first party libraries
+import bocce.logs as logs
+
+
+def test_access_log_writes_batches_of_json_lines():
+    stream = io.StringIO()
+    access_log = logs.AccessLog(stream, format='json', interval=60.0)
+    access_log.record(200, 'GET', '/users/1')
+    access_log.record(500, 'POST', '/users', 'Traceback')
+    access_log.close()
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert (first['status'], first['method'], first['path']) == (200, 'GET', '/users/1')
+    assert 'traceback' not in first
+    assert second['traceback'] == 'Traceback'
+    assert first['time'].endswith('Z')
+
+
+def test_access_log_drops_records_beyond_max_pending():
+    stream = io.StringIO()
+    access_log = logs.AccessLog(
+        stream, max_pending=2, batch_size=10, interval=60.0,
+    )
+    for index in range(5):
+        access_log.record(404, 'GET', '/{}'.format(index))
+    assert access_log.dropped == 3
+    access_log.flush()
+    assert stream.getvalue().splitlines()[1].endswith('404 GET     /1')
+    assert len(stream.getvalue().splitlines()) == 2
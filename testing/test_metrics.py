@@ -0,0 +1,91 @@
+# standard libraries
+import os
+import threading
+# third party libraries
+pass
+# first party libraries
+import bocce
+import bocce.metrics as metrics
+
+
+def test_metrics_merge_threads_and_format_text():
+    registry = metrics.Registry()
+    counter = registry.counter('jobs_total', 'Jobs done.', ('queue', ))
+    gauge = registry.gauge('jobs_running', 'Jobs running.')
+    histogram = registry.histogram('job_seconds', 'Job durations.', (), (0.1, 1.0))
+    assert registry.counter('jobs_total', 'Jobs done.', ('queue', )) is counter
+    def work():
+        for _ in range(100):
+            counter.inc(labels=('a"b', ))
+            gauge.inc()
+            histogram.observe(0.5)
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    gauge.set(3)
+    gauge.dec()
+    text = registry.exposition()
+    assert 'jobs_total{queue="a\\"b"} 400\n' in text
+    assert 'jobs_running 2\n' in text
+    assert 'job_seconds_bucket{le="0.1"} 0\n' in text
+    assert 'job_seconds_bucket{le="1.0"} 400\n' in text
+    assert 'job_seconds_bucket{le="+Inf"} 400\n' in text
+    assert 'job_seconds_sum 200\n' in text
+    assert 'job_seconds_count 400\n' in text
+
+
+def test_registry_sums_the_files_of_other_processes(tmpdir):
+    registry = metrics.Registry(directory=str(tmpdir))
+    counter = registry.counter('jobs_total')
+    gauge = registry.gauge('jobs_running')
+    counter.inc(2)
+    gauge.inc(5)
+    pid = os.fork()
+    if pid == 0:
+        # the child counts from zero and its gauges go when it exits
+        counter.inc(3)
+        gauge.inc(1)
+        registry.write()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    samples = dict(
+        (metric.name, samples) for metric, samples in registry.aggregate()
+    )
+    assert samples['jobs_total'] == {(): [5.0]}
+    assert samples['jobs_running'] == {(): [5.0]}
+
+
+def test_application_records_requests(wsgi_request):
+    application = bocce.Application()
+    def handler(request, response, configuration):
+        response.body.json = {'numbers': list(range(1000))}
+    handler.after = [bocce.middleware.compress]
+    application.routes.add_handler('/numbers', handler)
+    application.expose_metrics()
+    application.configure()
+    wsgi_request(application, '/numbers', {'HTTP_ACCEPT_ENCODING': 'gzip'})
+    wsgi_request(application, '/missing')
+    status, headers, body = wsgi_request(application, '/metrics')
+    assert headers['Content-Type'] == metrics.content_type
+    text = body.decode('utf-8')
+    assert 'bocce_requests_total{route="/numbers",method="GET",status="200"} 1\n' in text
+    assert 'bocce_requests_total{route="",method="GET",status="404"} 1\n' in text
+    assert 'bocce_requests_in_flight 1\n' in text
+    assert 'bocce_request_duration_seconds_count{route="/numbers"} 1\n' in text
+    assert 'bocce_response_compression_ratio_bucket{route="/numbers",le="0.5"} 1\n' in text
+
+
+def test_failed_responses_are_not_left_in_flight(wsgi_request):
+    application = bocce.Application()
+    def broken(request, response, configuration):
+        response.body.json = {'value': object()}
+    application.routes.add_handler('/broken', broken)
+    application.configure()
+    for _ in range(2):
+        try:
+            wsgi_request(application, '/broken')
+        except TypeError:
+            pass
+    assert application.metrics.in_flight.collect() == {(): [0.0]}
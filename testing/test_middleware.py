@@ -0,0 +1,99 @@
+# standard libraries
+pass
+# third party libraries
+pass
+# first party libraries
+import bocce
+import bocce.exceptions as exceptions
+import bocce.middleware as middleware
+
+
+def recorder(name, calls):
+    def record(request, response, configuration):
+        calls.append((name, configuration))
+    return record
+
+
+def test_pipeline_runs_befores_handler_and_reversed_afters():
+    calls = []
+    def failing_after(request, response, configuration):
+        raise ValueError
+    run = middleware.pipeline(
+        [recorder('before1', calls), recorder('before2', calls)],
+        recorder('handler', calls),
+        [recorder('after1', calls), failing_after, recorder('after2', calls)],
+        {'setting': 1},
+    )
+    run(None, None)
+    assert [name for name, _ in calls] == [
+        'before1', 'before2', 'handler', 'after2', 'after1',
+    ]
+    assert all(configuration == {'setting': 1} for _, configuration in calls)
+
+
+def test_pipeline_binds_middleware_once():
+    calls = []
+    binds = []
+    before = recorder('before', calls)
+    def bind(configuration):
+        binds.append(configuration)
+        return recorder('bound', calls)
+    before.bind = bind
+    skipped = recorder('skipped', calls)
+    skipped.bind = lambda configuration: None
+    run = middleware.pipeline([before, skipped], recorder('handler', calls), [], {})
+    run(None, None)
+    run(None, None)
+    assert binds == [{}]
+    assert [name for name, _ in calls] == ['bound', 'handler'] * 2
+
+
+def test_require_https_is_dropped_when_not_secure():
+    configuration = {'bocce': {'secure': False}}
+    assert middleware.bind(middleware.require_https, configuration) is None
+    assert middleware.bind(middleware.require_https, {}) is not None
+
+
+def test_pipeline_returns_a_short_circuiting_handler():
+    calls = []
+    redirect = exceptions.PermanentRedirectHandler(scheme='https')
+    def before(request, response, configuration):
+        return redirect
+    run = middleware.pipeline(
+        [before, recorder('before', calls)], recorder('handler', calls),
+        [recorder('after', calls)], {},
+    )
+    assert run(None, None) is redirect
+    assert calls == []
+
+
+def test_returned_handlers_respond_without_a_traceback(wsgi_request):
+    application = bocce.Application()
+    def handler(request, response, configuration):
+        return exceptions.PermanentRedirectHandler(scheme='https')
+    application.routes.add_handler('/', handler)
+    application.configure()
+    responses = []
+    application.log = lambda request, response, configuration: \
+        responses.append(response)
+    started = [
+        wsgi_request(application, path)[0] for path in ('/', '/missing')
+    ]
+    assert [status[:3] for status in started] == ['301', '404']
+    assert not any(hasattr(response, 'traceback') for response in responses)
+    assert responses[0].headers['Location'][0].startswith('https://')
+
+
+def test_middleware_added_after_configure_is_run(wsgi_request):
+    application = bocce.Application()
+    calls = []
+    def handler(request, response, configuration):
+        calls.append('handler')
+    route = application.routes.add_handler('/', handler)
+    route.add_to_before(lambda request, response, configuration: calls.append('m1'))
+    application.configure()
+    route.add_to_before(
+        lambda request, response, configuration: calls.append('m2'), 1
+    )
+    wsgi_request(application, '/')
+    assert calls == ['m1', 'm2', 'handler']
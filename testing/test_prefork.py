@@ -0,0 +1,132 @@
+# standard libraries
+import os
+import signal
+import time
+# third party libraries
+pass
+# first party libraries
+import bocce.prefork as prefork
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_supervisor_restarts_crashed_workers(tmpdir):
+    pid_filename = str(tmpdir.join('PID'))
+    def target(index):
+        marker = str(tmpdir.join('crashed.{}'.format(index)))
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            raise RuntimeError('crash')
+        time.sleep(60)
+    supervisor_pid = os.fork()
+    if supervisor_pid == 0:
+        try:
+            prefork.Supervisor(target, 2, pid_filename, restart_delay=0.1).run()
+        finally:
+            os._exit(0)
+    try:
+        for index in range(2):
+            wait_for(lambda: tmpdir.join('crashed.{}'.format(index)).exists())
+        # the crashed workers' PID files are removed before they are replaced
+        time.sleep(0.5)
+        wait_for(lambda: all(
+            tmpdir.join('PID.{}'.format(index)).exists() for index in range(2)
+        ))
+        assert tmpdir.join('PID').read() == str(supervisor_pid)
+        for index in range(2):
+            pid = int(tmpdir.join('PID.{}'.format(index)).read())
+            os.kill(pid, 0)
+    finally:
+        os.kill(supervisor_pid, signal.SIGTERM)
+        _, status = os.waitpid(supervisor_pid, 0)
+    assert os.WIFEXITED(status)
+    assert sorted(os.listdir(str(tmpdir))) == ['crashed.0', 'crashed.1']
+
+
+def exited(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid), 'r') as f:
+            return f.read().split()[2] == 'Z'
+    except IOError:
+        return True
+
+
+def test_supervisor_reload_replaces_workers_once_they_are_ready(tmpdir):
+    pid_filename = str(tmpdir.join('PID'))
+    def target(index):
+        time.sleep(0.5)
+        tmpdir.join('ready.{}'.format(os.getpid())).write('')
+        prefork.notify_ready()
+        time.sleep(60)
+    supervisor_pid = os.fork()
+    if supervisor_pid == 0:
+        try:
+            prefork.Supervisor(target, 2, pid_filename).run()
+        finally:
+            os._exit(0)
+    def worker_pids():
+        try:
+            return {
+                int(tmpdir.join('PID.{}'.format(index)).read()) 
+                for index in range(2)
+            }
+        except (IOError, ValueError):
+            return set()
+    try:
+        wait_for(lambda: len(tmpdir.listdir(lambda p: 'ready' in p.basename)) == 2)
+        old_pids = worker_pids()
+        os.kill(supervisor_pid, signal.SIGHUP)
+        wait_for(lambda: len(worker_pids() & old_pids) == 0 and len(worker_pids()) == 2)
+        # the old workers are only stopped once their replacements are ready
+        for pid in old_pids:
+            assert not exited(pid)
+        wait_for(lambda: all(exited(pid) for pid in old_pids))
+        for pid in worker_pids():
+            assert tmpdir.join('ready.{}'.format(pid)).exists()
+    finally:
+        os.kill(supervisor_pid, signal.SIGTERM)
+        os.waitpid(supervisor_pid, 0)
+
+
+def test_supervisor_generations_are_not_reused_after_a_failed_reload():
+    supervisor = prefork.Supervisor(None, 1, ready_timeout=0.0)
+    pids = iter(range(1, 100))
+    def spawn(index, generation=None):
+        pid = next(pids)
+        supervisor.workers[pid] = prefork._Worker(
+            pid, index, supervisor.generation, None
+        )
+    def stop_worker(worker):
+        worker.stop_deadline = time.monotonic() + 60.0
+    supervisor.spawn = spawn
+    supervisor._stop_worker = stop_worker
+    def start(ready):
+        supervisor._start_generation()
+        for worker in supervisor.workers.values():
+            if worker.generation == supervisor.generation:
+                worker.ready = ready
+        supervisor._check_generations()
+    start(True)
+    assert supervisor.active_generation == 1
+    # not ready in time, so rolled back; its workers are still draining
+    start(False)
+    assert (supervisor.generation, supervisor.active_generation) == (2, 1)
+    assert supervisor.workers[2].stop_deadline is not None
+    start(True)
+    assert (supervisor.generation, supervisor.active_generation) == (3, 3)
+    assert supervisor.workers[1].stop_deadline is not None
+    assert supervisor.workers[3].stop_deadline is None
+
+
+def test_listen_with_reuse_port_shares_the_port():
+    first = prefork.listen('127.0.0.1', 0, reuse_port=True)
+    port = first.getsockname()[1]
+    second = prefork.listen('127.0.0.1', port, reuse_port=True)
+    assert second.getsockname()[1] == port
+    first.close()
+    second.close()
@@ -1,5 +1,7 @@
 # standard libraries
 import datetime
+import urllib.parse
+import uuid
 # third party libraries
 import pytest
 # first party libraries
@@ -66,7 +68,7 @@ def test_route_mismatch(route_path, match_path):
     route = routing.Route(route_path, handler)
     assert route.match(match_path) is None
 
-"""
+
 def test_route_match_with_methods_and_subdomains():
     handler = lambda request, configuration: None
     route = routing.Route('{a}/b', handler)
@@ -77,7 +79,7 @@ def test_route_match_with_methods_and_subdomains():
         '{a}/b', handler, methods=('POST', ), subdomains=('api', 'www', )
     )
     assert route.match('a/b', method='POST', subdomain='api') == {'a': 'a'}
-"""
+
 
 def test_route_match_with_methods():
     handler = lambda request, configuration: None
@@ -87,7 +89,7 @@ def test_route_match_with_methods():
     assert route.match('a/b') == None
     assert route.match('a/b', method='POST') == {'a': 'a'}
 
-"""
+
 def test_route_match_with_subdomains():
     handler = lambda request, configuration: None
     route = routing.Route('{a}/b', handler)
@@ -95,7 +97,7 @@ def test_route_match_with_subdomains():
     route = routing.Route('{a}/b', handler, subdomains=('www', 'api', ))
     assert route.match('a/b') == None
     assert route.match('a/b', subdomain='api') == {'a': 'a'}
-"""
+
 
 def test_routes_container():
     routes = routing.Routes()
@@ -164,6 +166,21 @@ def test_routes_matching(path, method, route, segments):
     assert routes.match(path, method) == (route, segments)
 
 
+def test_routes_matching_with_subdomains():
+    routes = routing.Routes()
+    handler = lambda request, configuration: None
+    www = routes.add_handler('{a}', handler)
+    api = routes.add_handler('{a}', handler, subdomains=('api', ))
+    static = routes.add_handler('{a}', handler, methods=('GET', 'HEAD', ), 
+                                subdomains=('static', ))
+    assert routes.match('b', 'GET', None) == (www, {'a': 'b'})
+    assert routes.match('b', 'GET', 'www') == (www, {'a': 'b'})
+    assert routes.match('b', 'GET', 'api') == (api, {'a': 'b'})
+    assert routes.match('b', 'HEAD', 'static') == (static, {'a': 'b'})
+    assert routes.match('b', 'HEAD', 'api') is None
+    assert routes.match('b', 'GET', 'other') is None
+
+
 def test_routes_benchmark(N=1000):
     routes.cache.size = 0
     start = datetime.datetime.now()
@@ -174,5 +191,205 @@ def test_routes_benchmark(N=1000):
     assert duration < 1e-4
 
 
+def test_routes_match_verbatim_literally():
+    routes = routing.Routes()
+    handler = lambda request, configuration: None
+    routes.add_handler('api/1.1/{username}', handler)
+    assert routes.match('api/1.1/guido')[1] == {'username': 'guido'}
+    assert routes.match('api/1x1/guido') is None
+
+
+def test_routes_match_after_mutation():
+    routes = routing.Routes()
+    handler = lambda request, configuration: None
+    routes.add_handler('{a}', handler)
+    assert routes.match('b') == (routes[0], {'a': 'b'})
+    route = routes.add_handler('b', handler)
+    assert routes.match('b') == (route, {})
+    routes.pop()
+    assert routes.match('b') == (routes[0], {'a': 'b'})
+
+
+def test_routes_typed_segments():
+    routes = routing.Routes()
+    handler = lambda request, configuration: None
+    by_id = routes.add_handler('users/{id:int}', handler)
+    by_date = routes.add_handler('users/{d:date}', handler)
+    by_name = routes.add_handler('users/{name}', handler)
+    by_uid = routes.add_handler('users/v{uid:uuid}/<rest:path>', handler)
+    assert routes.match('users/42') == (by_id, {'id': 42})
+    assert routes.match('users/2016-02-29') == (
+        by_date, {'d': datetime.date(2016, 2, 29)}
+    )
+    assert routes.match('users/2015-02-29') == (by_name, {'name': '2015-02-29'})
+    assert routes.match('users/guido') == (by_name, {'name': 'guido'})
+    uid = uuid.uuid4()
+    assert routes.match('users/v{}/a/b'.format(uid)) == (
+        by_uid, {'uid': uid, 'rest': 'a/b'}
+    )
+    assert by_id.match('users/42') == {'id': 42}
+    assert by_id.match('users/guido') is None
+
+
+def test_routes_curly_path_segments():
+    routes = routing.Routes()
+    handler = lambda request, configuration: None
+    files = routes.add_handler('files/{p:path}', handler, name='files')
+    routes.add_handler('files/{name}/meta', handler)
+    assert routes.match('/files/a/b') == (files, {'p': 'a/b'})
+    assert files.match('/files/a/b') == {'p': 'a/b'}
+    url = routes.url_for('files', p='a/b c')
+    assert url == '/files/a/b%20c'
+    assert routes.match(urllib.parse.unquote(url)) == (files, {'p': 'a/b c'})
+
+
+def test_route_unknown_converter():
+    handler = lambda request, configuration: None
+    with pytest.raises(ValueError):
+        routing.Route('users/{id:integer}', handler)
+
+
+def test_route_invalid_placeholders():
+    handler = lambda request, configuration: None
+    for path in ('{a}/{a}', 'x/<a>/<a>', 'users/{id:int}/{id}', '{a-b}'):
+        with pytest.raises(ValueError):
+            routing.Route(path, handler)
+    routes = routing.Routes()
+    routes.add_handler('<a>', handler)
+    mounted = routing.Routes()
+    with pytest.raises(ValueError):
+        mounted.add_routes('/<a>', routes)
+
+
+def test_routes_url_for():
+    routes = routing.Routes()
+    handler = lambda request, configuration: None
+    routes.add_handler('/', handler, name='home')
+    user = routes.add_handler('api/{version}/users/{id:int}', handler, name='user')
+    routes.add_handler('static/<path>', handler, name='static')
+    assert routes.url_for('home') == '/'
+    assert routes.url_for('user', version='1.1', id=7) == '/api/1.1/users/7'
+    assert routes.url_for(user, version='a/b', id=7) == '/api/a%2Fb/users/7'
+    assert routes.url_for('user', version=1, id=7, q='a b') == \
+        '/api/1/users/7?q=a%20b'
+    assert routes.url_for('static', path='css/a.css') == '/static/css/a.css'
+    with pytest.raises(KeyError):
+        routes.url_for('user', version='1.1')
+    with pytest.raises(KeyError):
+        routes.url_for('unknown')
+
+
+def test_routes_negative_cache():
+    routes = routing.Routes()
+    handler = lambda request, configuration: None
+    routes.add_handler('a', handler)
+    assert routes.match('.env') is None
+    assert ('.env', None, None) in routes.negative_cache
+    route = routes.add_handler('.env', handler)
+    assert len(routes.negative_cache) == 0
+    assert routes.match('.env') == (route, {})
+
+
+def test_routes_negative_cache_hits_skip_the_admission_sketch():
+    routes = routing.Routes(cache_admission=True)
+    routes.add_handler('a', lambda request, configuration: None)
+    for _ in range(5):
+        assert routes.match('.env') is None
+    assert routes.cache._sketch.frequency(('.env', None, None)) == 1
+
+
+def test_routes_freeze_and_snapshot(tmpdir):
+    snapshot = str(tmpdir.join('routes.snapshot'))
+    handler = lambda request, configuration: None
+    def create_routes():
+        routes = routing.Routes()
+        routes.add_handler('', handler)
+        routes.add_handler('a/{b:int}/c', handler)
+        routes.add_handler('a/{b}/x{c}', handler, methods=('POST', ))
+        routes.add_handler('a/<b>', handler)
+        return routes
+    routes = create_routes()
+    routes.freeze(snapshot)
+    with pytest.raises(RuntimeError):
+        routes.add_handler('d', handler)
+    loaded_routes = create_routes()
+    loaded_routes.freeze(snapshot)
+    assert '_segments' in loaded_routes[1].__dict__
+    for path, method in (('', 'GET'), ('a/1/c', 'GET'), ('a/b/xc', 'POST'), 
+                         ('a/b/c/d', 'GET'), ('a/b/c', 'GET'), ('e', 'GET')):
+        match = routes.match(path, method)
+        loaded_match = loaded_routes.match(path, method)
+        if match is None:
+            assert loaded_match is None
+        else:
+            assert routes.index(match[0]) == loaded_routes.index(loaded_match[0])
+            assert match[1] == loaded_match[1]
+    loaded_routes.thaw()
+    loaded_routes.add_handler('d', handler)
+    loaded_routes.freeze(snapshot)
+    assert loaded_routes.match('d', 'GET')[0] is loaded_routes[-1]
+
+
+def test_routes_shared_handlers():
+    class Handler:
+        before = []
+        def __call__(self, request, response, configuration):
+            pass
+    handler = Handler()
+    middleware = lambda request, response, configuration: None
+    routes = routing.Routes(share_handlers=True)
+    a = routes.add_handler('a', handler)
+    b = routes.add_handler('b', handler)
+    copied = routes.add_handler('c', handler, share_handler=False)
+    assert a.handler is handler and b.handler is handler
+    assert copied.handler is not handler
+    a.add_to_before(middleware)
+    assert a.before == [middleware]
+    assert b.before == [] and Handler.before == []
+    mounted = routing.Routes()
+    mounted.add_routes('/api', routes)
+    assert mounted[0].handler is handler
+    assert mounted[0].before == [middleware]
+    mounted.add_to_after(middleware)
+    assert mounted[0].after == [middleware]
+    assert a.after == () and not hasattr(handler, 'after')
+    copied.add_to_before(middleware)
+    assert copied.before == [middleware]
+    assert copied.handler.before == [] and Handler.before == []
+
+
+def test_routes_copied_handlers_keep_their_own_middleware():
+    def handler(request, response, configuration):
+        pass
+    middleware = lambda request, response, configuration: None
+    routes = routing.Routes()
+    a = routes.add_handler('a', handler)
+    b = routes.add_handler('b', handler)
+    a.add_to_before(middleware)
+    assert a.before == [middleware] and b.before == []
+    mounted = routing.Routes()
+    mounted.add_routes('/x', routes)
+    assert mounted[0].before == [middleware]
+    assert mounted[1].before == []
+    mounted[1].add_to_before(middleware)
+    assert mounted[0].before == [middleware] and b.before == []
+
+
+def test_routes_benchmark_scaling(N=1000):
+    handler = lambda request, configuration: None
+    durations = []
+    for number_routes in (10, 10000):
+        routes = routing.Routes(cache_size=0)
+        for i in range(number_routes):
+            routes.add_handler('api/{{version}}/users{}/{{username}}'.format(i), handler)
+        routes.match('api/1.1/users7/guido')
+        start = datetime.datetime.now()
+        for i in range(N):
+            routes.match('api/1.1/users7/guido')
+        stop = datetime.datetime.now()
+        durations.append((stop - start).total_seconds()/float(N))
+    assert durations[1] < 10*durations[0]
+
+
 if __name__ == '__main__':
     pytest.main()
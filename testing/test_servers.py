@@ -0,0 +1,78 @@
+# standard libraries
+import asyncio
+import http.client
+import socket
+import threading
+import time
+# third party libraries
+import pytest
+# first party libraries
+import bocce.prefork as prefork
+import bocce.servers as servers
+
+
+def application(environment, start_response):
+    body = environment['wsgi.input'].read()
+    if environment['PATH_INFO'] == '/stream':
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return (b'chunk' for _ in range(3))
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [environment['PATH_INFO'].encode('latin-1'), b' ', body]
+
+
+@pytest.fixture
+def server():
+    listener = prefork.listen('127.0.0.1', 0)
+    server = servers.HTTPServer(application, threads=2, buffer_size=1)
+    thread = threading.Thread(
+        target=asyncio.run, args=(server.serve([listener]), )
+    )
+    thread.start()
+    while server.loop is None or not hasattr(server, 'stopping'):
+        time.sleep(0.01)
+    yield server, listener.getsockname()[1]
+    server.stop()
+    thread.join()
+
+
+def test_keep_alive_reuses_the_connection(server):
+    _, port = server
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    for path in ('/a', '/b'):
+        connection.request('POST', path, body=b'data')
+        response = connection.getresponse()
+        assert response.read() == path.encode('ascii') + b' data'
+    connection.request('GET', '/stream')
+    response = connection.getresponse()
+    assert response.getheader('Transfer-Encoding') == 'chunked'
+    assert response.read() == b'chunk'*3
+    connection.close()
+
+
+def test_pipelined_requests_are_answered_in_order(server):
+    _, port = server
+    client = socket.create_connection(('127.0.0.1', port))
+    client.sendall(
+        b'GET /first HTTP/1.1\r\nHost: x\r\n\r\n'
+        b'POST /second HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n'
+        b'3\r\nabc\r\n0\r\n\r\n'
+        b'GET /third HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n'
+    )
+    data = b''
+    while True:
+        chunk = client.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    client.close()
+    assert data.count(b'HTTP/1.1 200 OK') == 3
+    positions = [data.index(part) for part in (b'/first', b'/second', b'abc', b'/third')]
+    assert positions == sorted(positions)
+
+
+def test_malformed_requests_are_rejected(server):
+    _, port = server
+    client = socket.create_connection(('127.0.0.1', port))
+    client.sendall(b'NONSENSE\r\n\r\n')
+    assert client.recv(65536).startswith(b'HTTP/1.1 400 Bad Request')
+    client.close()
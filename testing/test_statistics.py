@@ -0,0 +1,49 @@
+# standard libraries
+import threading
+# third party libraries
+pass
+# first party libraries
+import bocce
+import bocce.statistics as statistics
+
+
+def handler(request, response, configuration):
+    pass
+
+
+def test_statistics_count_matches_per_route():
+    routes = bocce.Routes()
+    routes.statistics = statistics.Statistics()
+    routes.add_handler('/users/{id}', handler, name='user')
+    routes.match('/users/1', 'GET')
+    routes.match('/users/1', 'GET')
+    routes.match('/users/2', 'GET')
+    routes.match('/missing', 'GET')
+    routes.match('/missing', 'GET')
+    snapshot = routes.statistics.snapshot()
+    user, missing = snapshot
+    assert user['name'] == 'user'
+    assert user['path'] == '/users/{id}'
+    assert (user['hits'], user['cache_hits'], user['cache_misses']) == (3, 1, 2)
+    assert missing['path'] is None
+    assert (missing['cache_hits'], missing['cache_misses']) == (1, 1)
+
+
+def test_statistics_merge_threads_into_cumulative_buckets():
+    recorder = statistics.Statistics(buckets=(0.1, 1.0, float('inf')))
+    route = bocce.Route('/', handler)
+    def work():
+        for duration in (0.05, 0.5, 5.0):
+            recorder.record_response(route, 200, duration)
+        recorder.record_response(route, 404, 0.05)
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latency = recorder.snapshot()[0]['latency']
+    assert latency['count'] == 16
+    assert latency['buckets'] == {'0.1': 8, '1.0': 12, '+Inf': 16}
+    assert recorder.snapshot()[0]['status_codes'] == {'200': 12, '404': 4}
+    recorder.reset()
+    assert recorder.snapshot() == []
@@ -0,0 +1,60 @@
+# standard libraries
+pass
+# third party libraries
+pass
+# first party libraries
+import bocce
+import bocce.timing as timing
+
+
+def test_timing_reports_every_phase(wsgi_request):
+    application = bocce.Application()
+    calls = []
+    def before(request, response, configuration):
+        response.headers['X-Before'] = 'yes'
+    def handler(request, response, configuration):
+        response.body.json = {'hello': 'world'}
+    handler.before = [before]
+    application.routes.add_handler('/hello', handler)
+    application.configure()
+    application.enable_timing(
+        sink=lambda request, response, durations: calls.append(durations)
+    )
+    status, headers, body = wsgi_request(application, '/hello')
+    assert status.startswith('200')
+    assert headers['X-Before'] == 'yes'
+    assert body == b'{"hello": "world"}'
+    assert list(calls[0]) == list(timing.phases)
+    assert all(duration >= 0.0 for duration in calls[0].values())
+    server_timing = headers['Server-Timing'].split(', ')
+    assert [metric.split(';')[0] for metric in server_timing] == list(timing.phases)
+    application.disable_timing()
+    status, headers, body = wsgi_request(application, '/hello')
+    assert 'Server-Timing' not in headers
+    assert len(calls) == 1
+
+
+def test_expired_requests_skip_the_handler_and_afters(wsgi_request):
+    application = bocce.Application()
+    calls = []
+    def before(request, response, configuration):
+        calls.append(request.remaining())
+    def handler(request, response, configuration):
+        calls.append('handler')
+    def after(request, response, configuration):
+        calls.append('after')
+    handler.timeout = 10.0
+    handler.before = [before]
+    handler.after = [after]
+    application.routes.add_handler('/slow', handler)
+    application.configure()
+    status, _, _ = wsgi_request(application, '/slow')
+    assert status.startswith('200')
+    assert 9.0 < calls[0] <= 10.0
+    assert calls[1:] == ['handler', 'after']
+    del calls[:]
+    status, _, _ = wsgi_request(
+        application, '/slow', {'HTTP_X_REQUEST_TIMEOUT': '0'}
+    )
+    assert status.startswith('504')
+    assert calls == []
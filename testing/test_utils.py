@@ -0,0 +1,87 @@
+# standard libraries
+import threading
+# third party libraries
+import pytest
+# first party libraries
+import bocce.utils as utils
+
+
+def test_clock_cache_evicts_unreferenced_entries():
+    cache = utils.ClockCache(3, shards=1)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['c'] = 3
+    assert cache['a'] == 1
+    cache['d'] = 4
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert len(cache) == 3
+    assert cache.statistics['evictions'] == 1
+
+
+def test_clock_cache_counts_hits_and_misses():
+    cache = utils.ClockCache(10)
+    cache['a'] = 1
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    with pytest.raises(KeyError):
+        cache['b']
+    statistics = cache.statistics
+    assert statistics['hits'] == 1
+    assert statistics['misses'] == 2
+
+
+def test_clock_cache_resizing_and_deletion():
+    cache = utils.ClockCache(10, shards=2)
+    for i in range(10):
+        cache[i] = i
+    cache.size = 0
+    assert len(cache) == 0
+    cache.size = 4
+    cache['a'] = 1
+    del cache['a']
+    assert 'a' not in cache
+    cache['b'] = 2
+    assert dict(cache.items()) == {'b': 2}
+
+
+def test_clock_cache_admission_protects_frequent_keys():
+    cache = utils.ClockCache(100, shards=1, admission=True)
+    for round in range(100):
+        for i in range(50):
+            if cache.get(('hot', i)) is None:
+                cache[('hot', i)] = i
+        for i in range(100):
+            key = ('cold', round, i)
+            if cache.get(key) is None:
+                cache[key] = i
+    hot = sum(1 for i in range(50) if ('hot', i) in cache)
+    assert hot > 45
+    assert cache.statistics['rejections'] > 0
+
+
+def test_clock_cache_is_thread_safe(number_threads=16, N=5000):
+    cache = utils.ClockCache(64)
+    errors = []
+    def work(offset):
+        try:
+            for i in range(N):
+                key = (i + offset) % 256
+                cache[key] = key
+                value = cache.get(key)
+                assert value is None or value == key
+        except Exception as exception:
+            errors.append(exception)
+    threads = [
+        threading.Thread(target=work, args=(i, )) for i in range(number_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(cache) <= 64
+
+
+if __name__ == '__main__':
+    pytest.main()